@@ -0,0 +1,322 @@
+#!/usr/bin/env python3
+
+import argparse
+import datetime
+import os
+import random
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+from dataclasses import dataclass
+from typing import Any, Optional
+
+import numpy as np
+
+import pathogens
+from pathogen_properties import IncidenceAbsolute, Population
+from tree import FlatTree, Tree
+
+
+def random_tree(size: int, seed: int) -> Tree[int]:
+    """A tree of size nodes, each attached to a random earlier node."""
+    rng = random.Random(seed)
+    parents = [-1] + [rng.randrange(i) for i in range(1, size)]
+    # Not in preorder, so we can't use Tree.from_preorder.
+    nodes = [Tree(0)]
+    for i, parent in enumerate(parents[1:], start=1):
+        node = Tree(i)
+        nodes[parent].children.append(node)
+        nodes.append(node)
+    return nodes[0]
+
+
+def tree_lookup(args: argparse.Namespace) -> None:
+    tree = random_tree(args.nodes, args.seed)
+    rng = random.Random(args.seed)
+    # Include some misses, which are the worst case for a scan.
+    queries = [rng.randrange(args.nodes * 2) for _ in range(args.lookups)]
+
+    def scan():
+        for query in queries:
+            tree._scan(query)
+
+    def build():
+        tree._index = None
+        tree[0]
+
+    def index():
+        for query in queries:
+            tree[query]
+
+    print(f"{args.nodes} nodes, {args.lookups} lookups")
+    for name, f in [("scan", scan), ("build", build), ("index", index)]:
+        seconds = min(timeit.repeat(f, number=1, repeat=args.repeat))
+        print(f"{name:>6}: {seconds:.4f}s")
+
+
+def clade_sums(args: argparse.Namespace) -> None:
+    tree = random_tree(args.nodes, args.seed)
+    values = np.random.default_rng(args.seed).integers(
+        0, 100, size=(args.nodes, args.columns)
+    )
+
+    def walk():
+        # Bottom-up over the Tree, the way build_clade_counts works.
+        totals = {}
+        for node in reversed(list(tree)):
+            total = values[node.data].copy()
+            for child in node.children:
+                total += totals[child.data]
+            totals[node.data] = total
+
+    flat = FlatTree.from_tree(tree)
+    preorder_values = values[flat.data]
+
+    print(f"{args.nodes} nodes, {args.columns} columns")
+    for name, f in [
+        ("walk", walk),
+        ("flatten", lambda: FlatTree.from_tree(tree)),
+        ("cumsum", lambda: flat.clade_sums(preorder_values)),
+    ]:
+        seconds = min(timeit.repeat(f, number=1, repeat=args.repeat))
+        print(f"{name:>8}: {seconds:.4f}s")
+
+
+def resolve_clades(args: argparse.Namespace) -> None:
+    tree = random_tree(args.nodes, args.seed)
+    rng = np.random.default_rng(args.seed)
+    tracked = set(rng.choice(args.nodes, args.tracked, replace=False).tolist())
+    taxids = rng.integers(0, args.nodes, size=args.taxids)
+
+    def search(taxids):
+        # One subtree search per tracked clade, keeping the deepest match.
+        resolved = []
+        for taxid in taxids.tolist():
+            best, best_size = -1, args.nodes + 1
+            for clade in tracked:
+                subtree = tree[clade]
+                if subtree is not None and taxid in subtree:
+                    size = len(list(subtree))
+                    if size < best_size:
+                        best, best_size = clade, size
+            resolved.append(best)
+        return resolved
+
+    def flat():
+        # Includes building the array tree and ancestor table.
+        FlatTree.from_tree(tree).resolve(taxids, tracked)
+
+    sample = taxids[: args.search_taxids]
+    print(
+        f"{args.nodes} nodes, {args.tracked} tracked, {args.taxids} taxids "
+        f"({len(sample)} for search)"
+    )
+    seconds = min(timeit.repeat(lambda: search(sample), number=1, repeat=1))
+    print(f"{'search':>7}: {seconds:.4f}s ({len(sample)} taxids)")
+    seconds = min(timeit.repeat(flat, number=1, repeat=args.repeat))
+    print(f"{'flat':>7}: {seconds:.4f}s ({len(taxids)} taxids)")
+
+
+@dataclass(kw_only=True, eq=False, frozen=True)
+class DictVariable:
+    """A Variable the way they were stored before slots and shared metadata.
+
+    The baseline for variable_memory: a plain dataclass with a __dict__,
+    every metadata field inline, and inputs as a frozenset.
+    """
+
+    value: float
+    source: Optional[str] = None
+    country: Optional[str] = None
+    state: Optional[str] = None
+    county: Optional[str] = None
+    number_of_participants: Optional[int] = None
+    confidence_interval: Optional[tuple[float, float]] = None
+    coverage_probability: Optional[float] = None
+    methods: Optional[str] = None
+    parsed_start: Optional[datetime.date] = None
+    parsed_end: Optional[datetime.date] = None
+    taxid: Optional[int] = None
+    direct_inputs: frozenset["DictVariable"] = frozenset()
+    is_pseudocount: Optional[bool] = None
+    tag: Optional[str] = None
+    _hash: int = 0
+
+    def __hash__(self) -> int:
+        return self._hash
+
+
+def variable_memory(args: argparse.Namespace) -> None:
+    location: dict[str, Any] = dict(
+        country="United States", state="California", county="Alameda County"
+    )
+    population = Population(
+        people=1_600_000, date="2020", source="census.gov", **location
+    )
+    dict_population = DictVariable(
+        value=1_600_000,
+        source="census.gov",
+        parsed_start=datetime.date(2020, 1, 1),
+        parsed_end=datetime.date(2020, 12, 31),
+        **location,
+    )
+    start = datetime.date(2020, 1, 1)
+    dates = [
+        (start + datetime.timedelta(days=i % 365)).isoformat()
+        for i in range(args.estimates)
+    ]
+
+    # Like the daily county estimates: an absolute count from a data file,
+    # converted to a rate.
+    def build_variables() -> list:
+        return [
+            IncidenceAbsolute(
+                annual_infections=i * 365,
+                date=date,
+                source="github.com/CSSEGISandData/COVID-19",
+                **location,
+            ).to_rate(population)
+            for i, date in enumerate(dates)
+        ]
+
+    def build_dict_variables() -> list:
+        estimates = []
+        for i, date in enumerate(dates):
+            absolute = DictVariable(
+                value=i * 365,
+                source="github.com/CSSEGISandData/COVID-19",
+                parsed_start=datetime.date.fromisoformat(date),
+                parsed_end=datetime.date.fromisoformat(date),
+                _hash=hash((i, date)),
+                **location,
+            )
+            estimates.append(
+                DictVariable(
+                    value=i * 365 * 100000 / 1_600_000,
+                    parsed_start=absolute.parsed_start,
+                    parsed_end=absolute.parsed_end,
+                    direct_inputs=frozenset([absolute, dict_population]),
+                    _hash=hash((i, date, 1)),
+                    **location,
+                )
+            )
+        return estimates
+
+    print(f"{args.estimates} estimates")
+    for name, build in [
+        ("dict-backed", build_dict_variables),
+        ("Variable", build_variables),
+    ]:
+        tracemalloc.start()
+        before, _ = tracemalloc.get_traced_memory()
+        estimates = build()
+        after, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del estimates
+        print(
+            f"{name:>11}: {(after - before) / args.estimates:.0f} bytes per "
+            f"estimate"
+        )
+
+
+def estimate_time(args: argparse.Namespace) -> None:
+    # Time computing estimates, not reading them from the cache.
+    os.environ["P2RA_ESTIMATES_CACHE_DIR"] = ""
+
+    # First, so the workers start from a fresh process.
+    start = time.perf_counter()
+    pathogens.all_estimates(processes=args.processes)
+    parallel = time.perf_counter() - start
+
+    seconds = {}
+    for pathogen_name in pathogens.pathogens:
+        start = time.perf_counter()
+        pathogens.compute_estimates(pathogen_name)
+        seconds[pathogen_name] = time.perf_counter() - start
+    slowest = max(seconds, key=lambda pathogen_name: seconds[pathogen_name])
+
+    print(f"{len(seconds)} pathogens")
+    print(f"{'serial':>9}: {sum(seconds.values()):.4f}s")
+    print(f"{'slowest':>9}: {seconds[slowest]:.4f}s ({slowest})")
+    print(f"{'parallel':>9}: {parallel:.4f}s")
+
+
+def import_time(args: argparse.Namespace) -> None:
+    for module in args.modules:
+        # Each import needs a fresh interpreter, since modules are cached.
+        code = (
+            "import time; start = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - start)"
+        )
+        seconds = min(
+            float(
+                subprocess.run(
+                    [sys.executable, "-c", code],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+            )
+            for _ in range(args.repeat)
+        )
+        print(f"{module:>10}: {seconds:.4f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Performance benchmarks")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    subparsers = parser.add_subparsers(required=True)
+
+    lookup_parser = subparsers.add_parser(
+        "tree-lookup", help="Tree lookups by index vs depth-first search"
+    )
+    lookup_parser.add_argument("--nodes", type=int, default=20_000)
+    lookup_parser.add_argument("--lookups", type=int, default=200)
+    lookup_parser.set_defaults(run=tree_lookup)
+
+    sums_parser = subparsers.add_parser(
+        "clade-sums", help="Clade sums by tree walk vs FlatTree"
+    )
+    sums_parser.add_argument("--nodes", type=int, default=200_000)
+    sums_parser.add_argument("--columns", type=int, default=8)
+    sums_parser.set_defaults(run=clade_sums)
+
+    resolve_parser = subparsers.add_parser(
+        "resolve-clades",
+        help="Nearest tracked ancestor by subtree search vs FlatTree",
+    )
+    resolve_parser.add_argument("--nodes", type=int, default=200_000)
+    resolve_parser.add_argument("--tracked", type=int, default=50)
+    resolve_parser.add_argument("--taxids", type=int, default=1_000_000)
+    resolve_parser.add_argument("--search-taxids", type=int, default=20)
+    resolve_parser.set_defaults(run=resolve_clades)
+
+    memory_parser = subparsers.add_parser(
+        "variable-memory",
+        help="Memory per estimate, as Variables vs dict-backed dataclasses",
+    )
+    memory_parser.add_argument("--estimates", type=int, default=100_000)
+    memory_parser.set_defaults(run=variable_memory)
+
+    estimates_parser = subparsers.add_parser(
+        "estimates",
+        help="Computing all estimates serially vs in a process pool",
+    )
+    estimates_parser.add_argument(
+        "--processes", type=int, help="Default: one per CPU"
+    )
+    estimates_parser.set_defaults(run=estimate_time)
+
+    import_parser = subparsers.add_parser(
+        "import-time", help="Time to import modules in a fresh interpreter"
+    )
+    import_parser.add_argument(
+        "modules", nargs="*", default=["pathogens", "stats"]
+    )
+    import_parser.set_defaults(run=import_time)
+
+    args = parser.parse_args()
+    args.run(args)
@@ -0,0 +1,30 @@
+import os
+import tempfile
+from pathlib import Path
+from typing import Optional
+
+
+def cache_dir(env_var: str, name: str) -> Optional[Path]:
+    """Where to cache things, ~/.cache/p2ra/<name> unless env_var is set.
+
+    Setting env_var to the empty string disables caching.
+    """
+    cache_dir = os.environ.get(env_var)
+    if cache_dir == "":
+        return None  # Caching disabled
+    if cache_dir is None:
+        return Path.home() / ".cache" / "p2ra" / name
+    return Path(cache_dir)
+
+
+def atomic_write(dest: Path, data: bytes) -> None:
+    """Write dest so concurrent readers never see a partial file."""
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, prefix=f".{dest.name}.")
+    try:
+        with os.fdopen(fd, "wb") as outf:
+            outf.write(data)
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
@@ -84,7 +84,7 @@ def start():
             n_matches = 0
             for bioproject in bioprojects:
                 matching_reads = mgs_data.viral_reads(bioproject, taxids)
-                viral_samples = mgs_data.sample_attributes(
+                viral_samples = mgs_data.sample_table(
                     bioproject,
                     enrichment=(
                         None if study == "brinch" else mgs.Enrichment.VIRAL
@@ -1,29 +1,25 @@
 #!/usr/bin/env python3
 
+import pandas as pd
+
 import mgs
 from pathogens import pathogens
 
 if __name__ == "__main__":
     bioproject = mgs.BioProject("PRJNA729801")  # Rothman
-    mgs_data = mgs.MGSData.from_repo()
-    samples = mgs_data.sample_attributes(
+    mgs_data = mgs.MGSData.from_repo(bioprojects=[bioproject])
+    samples = mgs_data.sample_table(
         bioproject, enrichment=mgs.Enrichment.VIRAL
     )
-
-    fine_locs = set(attribs.fine_location for _, attribs in samples.items())
+    fine_locations = samples.df["fine_location"]
 
     for pathogen_name, pathogen in pathogens.items():
         print(pathogen_name)
         taxids = pathogen.pathogen_chars.taxids
-        virus_reads = mgs_data.viral_reads(bioproject, taxids)
-        print(" All", sum(virus_reads[s] for s in samples), sep="\t")
-        for fine_loc in fine_locs:
-            print(
-                f" {fine_loc}",
-                sum(
-                    virus_reads[s]
-                    for s, attribs in samples.items()
-                    if attribs.fine_location == fine_loc
-                ),
-                sep="\t",
-            )
+        virus_reads = pd.Series(
+            mgs_data.viral_reads(bioproject, taxids)
+        ).reindex(samples.df.index)
+        print(" All", virus_reads.sum(), sep="\t")
+        by_fine_location = virus_reads.groupby(fine_locations, observed=True)
+        for fine_loc, reads in by_fine_location.sum().items():
+            print(f" {fine_loc}", reads, sep="\t")
@@ -6,16 +6,12 @@ import pathogens
 def start():
     taxid_to_name = {}
     for pathogen_name, pathogen in pathogens.pathogens.items():
-        for taxids in pathogen_properties.by_taxids(
-            pathogen.pathogen_chars, pathogen.estimate_prevalences()
-        ):
-            for taxid in taxids:
-                taxid_to_name[taxid] = pathogen_name
-        for taxids in pathogen_properties.by_taxids(
-            pathogen.pathogen_chars, pathogen.estimate_incidences()
-        ):
-            for taxid in taxids:
-                taxid_to_name[taxid] = pathogen_name
+        for predictors in pathogens.estimates(pathogen_name).values():
+            for taxids in pathogen_properties.by_taxids(
+                pathogen.pathogen_chars, predictors
+            ):
+                for taxid in taxids:
+                    taxid_to_name[taxid] = pathogen_name
 
     print("taxid", "filename", "human_readable", sep="\t")
     for taxid, name in sorted(taxid_to_name.items()):
@@ -1,27 +1,130 @@
+import hashlib
 import json
+import logging
+import os
+import re
+import tarfile
+import time
+import urllib.error
 import urllib.request
+import zlib
 from collections import Counter
-from collections.abc import Iterable
-from dataclasses import dataclass
+from collections.abc import (
+    Callable,
+    Collection,
+    ItemsView,
+    Iterable,
+    Iterator,
+    Mapping,
+)
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from datetime import date
 from enum import Enum
-from typing import NewType, Optional
+from functools import cached_property
+from pathlib import Path
+from typing import (
+    Generic,
+    Hashable,
+    NewType,
+    Optional,
+    Protocol,
+    TypedDict,
+    TypeVar,
+)
 
+import numpy as np
+import pandas as pd
 from pydantic import BaseModel
 
+import cache
 from pathogen_properties import TaxID
-from tree import Tree
+from tree import FlatTree, Tree
 
-MGS_REPO_DEFAULTS = {
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+H = TypeVar("H", bound=Hashable)
+
+
+class RepoSpec(TypedDict):
+    user: str
+    repo: str
+    ref: str
+
+
+MGS_REPO_DEFAULTS: RepoSpec = {
     "user": "naobservatory",
     "repo": "mgs-pipeline",
     "ref": "data-2023-07-21",
 }
 
+
+# Downloads from the MGS repo are cached on disk; see GitHubRepo.  Override the
+# location with P2RA_MGS_CACHE_DIR, and set P2RA_MGS_OFFLINE=1 to only ever
+# read from the cache.
+def default_cache_dir() -> Optional[Path]:
+    return cache.cache_dir("P2RA_MGS_CACHE_DIR", "mgs")
+
+
+def default_offline() -> bool:
+    return os.environ.get("P2RA_MGS_OFFLINE", "") not in ["", "0"]
+
+
+class Default(Enum):
+    """For arguments where None means something other than the default."""
+
+    DEFAULT = "default"
+
+
 BioProject = NewType("BioProject", str)
 Sample = NewType("Sample", str)
 
 
+@dataclass
+class Interner(Generic[H]):
+    """Dense integer ids for values, numbered in order of first appearance.
+
+    We hash each accession or taxid once, when interning it, and after that
+    work with arrays of ids.
+    """
+
+    values: list[H] = field(default_factory=list)
+    ids: dict[H, int] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        values, self.values, self.ids = self.values, [], {}
+        for value in values:
+            self.intern(value)
+
+    def intern(self, value: H) -> int:
+        id = self.ids.get(value)
+        if id is None:
+            id = self.ids[value] = len(self.values)
+            self.values.append(value)
+        return id
+
+    def intern_all(self, values: Iterable[H]) -> np.ndarray:
+        return np.fromiter(
+            (self.intern(value) for value in values), dtype=np.int32
+        )
+
+    def lookup(self, values: Iterable[H]) -> np.ndarray:
+        """Ids of values, with -1 for any that haven't been interned."""
+        return np.fromiter(
+            (self.ids.get(value, -1) for value in values), dtype=np.int32
+        )
+
+    def __getitem__(self, id: int) -> H:
+        return self.values[id]
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __contains__(self, value: object) -> bool:
+        return value in self.ids
+
+
 target_bioprojects = {
     "crits_christoph": [BioProject("PRJNA661613")],
     "rothman": [BioProject("PRJNA729801")],
@@ -30,35 +133,198 @@ target_bioprojects = {
 }
 
 
+class DataSource(Protocol):
+    """Somewhere we can read mgs-pipeline files from.
+
+    Paths are relative to the root of the mgs-pipeline repo, for example
+    "dashboard/metadata_samples.json".
+    """
+
+    def get_file(self, path: str) -> bytes: ...
+
+
+def download(url: str) -> bytes:
+    with urllib.request.urlopen(url) as response:
+        if response.status == 200:
+            return response.read()
+        else:
+            raise ValueError(
+                f"Failed to download {url}. "
+                f"Response status code: {response.status}"
+            )
+
+
+@dataclass
+class LocalDirectory:
+    """A local checkout (or mirror) of the mgs-pipeline repo."""
+
+    root: Path
+
+    def get_file(self, path: str) -> bytes:
+        return (Path(self.root) / path).read_bytes()
+
+
+@dataclass
+class Tarball:
+    """A tarball of the mgs-pipeline repo, optionally compressed.
+
+    Files may be under a single top-level directory, as in the archives
+    GitHub generates.  The archive is decompressed as a stream, stopping at
+    the requested file, so it's never unpacked to disk or held in memory.
+    """
+
+    archive: Path
+
+    def get_file(self, path: str) -> bytes:
+        with tarfile.open(self.archive, mode="r|*") as tar:
+            for member in tar:
+                if member.isfile() and path in (
+                    member.name,
+                    member.name.split("/", 1)[-1],
+                ):
+                    contents = tar.extractfile(member)
+                    assert contents
+                    return contents.read()
+        raise FileNotFoundError(f"{path} not found in {self.archive}")
+
+
+@dataclass
+class HTTPSource:
+    """A copy of the mgs-pipeline repo served over HTTP.
+
+    For example a mirror on the local network, or a local stand-in server in
+    tests.
+    """
+
+    base_url: str
+
+    def get_file(self, path: str) -> bytes:
+        return download(f"{self.base_url.rstrip('/')}/{path}")
+
+
 @dataclass
 class GitHubRepo:
     user: str
     repo: str
     ref: str
+    # At a pinned ref (a tag or a commit sha) the contents of a file never
+    # change, so we keep a local copy indefinitely.  Branches can move, so
+    # we never cache them.  The cache is content-addressed: file contents
+    # live under objects/ named by their sha256, and
+    # refs/<user>/<repo>/<ref>/<path> holds the digest for that file.
+    # Objects are verified against their digest on every read.
+    cache_dir: Optional[Path] = field(default_factory=default_cache_dir)
+    # In offline mode we never touch the network, and it's an error to ask
+    # for a file that isn't already cached.
+    offline: bool = field(default_factory=default_offline)
 
-    def get_file(self, path: str) -> str:
-        file_url = (
+    def get_file(self, path: str) -> bytes:
+        # Only pinned refs are ever written to the cache, so a hit means
+        # the ref is pinned and we don't need to ask GitHub.
+        if self.cache_dir:
+            cached = self._read_cache(path)
+            if cached is not None:
+                return cached
+        if self.offline:
+            raise ValueError(
+                f"{self.user}/{self.repo}/{self.ref}/{path} is not cached "
+                f"and offline mode is set"
+            )
+        data = self._download(path)
+        if self.cache_dir and self.pinned:
+            self._write_cache(path, data)
+        return data
+
+    @cached_property
+    def pinned(self) -> bool:
+        """Whether ref is a full commit sha or a tag, which can't move."""
+        if re.fullmatch("[0-9a-f]{40}", self.ref):
+            return True
+        # We know the default is a tag, so don't spend a (rate limited) API
+        # request asking.
+        if (self.user, self.repo, self.ref) == (
+            MGS_REPO_DEFAULTS["user"],
+            MGS_REPO_DEFAULTS["repo"],
+            MGS_REPO_DEFAULTS["ref"],
+        ):
+            return True
+        return self._is_tag()
+
+    def _is_tag(self) -> bool:
+        try:
+            download(
+                f"https://api.github.com/repos/"
+                f"{self.user}/{self.repo}/git/ref/tags/{self.ref}"
+            )
+        except urllib.error.URLError as e:
+            # A 404 means it isn't a tag, so it's probably a branch.
+            if not (isinstance(e, urllib.error.HTTPError) and e.code == 404):
+                logger.warning(
+                    "Not caching %s/%s/%s: can't tell if it's a tag (%s)",
+                    self.user,
+                    self.repo,
+                    self.ref,
+                    e,
+                )
+            return False
+        return True
+
+    def _download(self, path: str) -> bytes:
+        return download(
             f"https://raw.githubusercontent.com/"
             f"{self.user}/{self.repo}/{self.ref}/{path}"
         )
-        with urllib.request.urlopen(file_url) as response:
-            if response.status == 200:
-                return response.read()
-            else:
-                raise ValueError(
-                    f"Failed to download {file_url}. "
-                    f"Response status code: {response.status}"
-                )
 
+    def _ref_path(self, path: str) -> Path:
+        assert self.cache_dir
+        return (
+            self.cache_dir / "refs" / self.user / self.repo / self.ref / path
+        )
+
+    def _object_path(self, digest: str) -> Path:
+        assert self.cache_dir
+        return self.cache_dir / "objects" / digest[:2] / digest
+
+    def _read_cache(self, path: str) -> Optional[bytes]:
+        # Anything missing, unreadable, or malformed is a cache miss.
+        try:
+            digest = self._ref_path(path).read_text().strip()
+            if not re.fullmatch("[0-9a-f]{64}", digest):
+                return None
+            data = self._object_path(digest).read_bytes()
+        except (OSError, UnicodeDecodeError):
+            return None
+        if hashlib.sha256(data).hexdigest() != digest:
+            # Corrupt or truncated; treat it as a miss so we download again.
+            return None
+        return data
+
+    def _write_cache(self, path: str, data: bytes) -> None:
+        digest = hashlib.sha256(data).hexdigest()
+        # Write the object before the ref that points to it, and write both
+        # atomically, so concurrent readers never see a partial file.
+        cache.atomic_write(self._object_path(digest), data)
+        cache.atomic_write(self._ref_path(path), digest.encode())
 
-def load_bioprojects(repo: GitHubRepo) -> dict[BioProject, list[Sample]]:
-    data = json.loads(repo.get_file("dashboard/metadata_bioprojects.json"))
+
+BIOPROJECTS_PATH = "dashboard/metadata_bioprojects.json"
+SAMPLES_PATH = "dashboard/metadata_samples.json"
+SAMPLE_COUNTS_PATH = "dashboard/human_virus_sample_counts.json"
+TAX_TREE_PATH = "dashboard/human_virus_tree.json"
+
+
+def parse_bioprojects(raw: bytes) -> dict[BioProject, list[Sample]]:
+    data = json.loads(raw)
     return {
         BioProject(bp): [Sample(s) for s in samples]
         for bp, samples in data.items()
     }
 
 
+def load_bioprojects(repo: DataSource) -> dict[BioProject, list[Sample]]:
+    return parse_bioprojects(repo.get_file(BIOPROJECTS_PATH))
+
+
 class Enrichment(Enum):
     VIRAL = "viral"
     PANEL = "panel"
@@ -77,31 +343,329 @@ class SampleAttributes(BaseModel):
     method: Optional[str] = None
 
 
-def load_sample_attributes(repo: GitHubRepo) -> dict[Sample, SampleAttributes]:
-    data = json.loads(repo.get_file("dashboard/metadata_samples.json"))
-    return {
-        Sample(s): SampleAttributes(**attribs) for s, attribs in data.items()
-    }
+# SampleAttributes fields that are stored as categoricals in a SampleTable.
+CATEGORICAL_SAMPLE_ATTRIBUTES = [
+    "country",
+    "state",
+    "county",
+    "location",
+    "fine_location",
+    "method",
+]
+REQUIRED_SAMPLE_ATTRIBUTES = ["country", "location", "date", "reads"]
+
+
+@dataclass(eq=False)
+class SampleTable(Mapping[Sample, SampleAttributes]):
+    """Sample metadata stored column-wise, indexed by sample.
+
+    The string attributes are categoricals, date is datetime64 (NaT where the
+    date isn't a real date, with the original string kept in raw_date), reads
+    is int64, and enrichment is a categorical over Enrichment values.  Acts as
+    a read-only mapping from Sample to SampleAttributes, building the
+    attributes on access.
+    """
+
+    df: pd.DataFrame
+
+    @staticmethod
+    def from_dict(data: Mapping[str, Mapping[str, object]]) -> "SampleTable":
+        """Build a table from {sample: attributes}, validating each column."""
+        df = pd.DataFrame(
+            {
+                name: [attrs.get(name) for attrs in data.values()]
+                for name in SampleAttributes.__fields__
+            },
+            index=pd.Index(list(data), name="sample"),
+            dtype=object,
+        )
+
+        for name in REQUIRED_SAMPLE_ATTRIBUTES:
+            missing = df[name].isna()
+            if missing.any():
+                raise ValueError(
+                    f"Samples missing {name}: {list(df.index[missing][:5])}"
+                )
+
+        for name in CATEGORICAL_SAMPLE_ATTRIBUTES:
+            values = df[name]
+            df[name] = values.where(values.isna(), values.astype(str)).astype(
+                "category"
+            )
+
+        reads = pd.to_numeric(df["reads"], errors="coerce")
+        invalid = reads.isna() | (reads != reads.round())
+        if invalid.any():
+            raise ValueError(
+                f"Non-integer reads: {dict(df['reads'][invalid][:5])}"
+            )
+        df["reads"] = reads.astype(np.int64)
+
+        enrichments = [e.value for e in Enrichment]
+        invalid = df["enrichment"].notna() & ~df["enrichment"].isin(
+            enrichments
+        )
+        if invalid.any():
+            raise ValueError(
+                f"Unknown enrichment: {dict(df['enrichment'][invalid][:5])}"
+            )
+        df["enrichment"] = pd.Categorical(
+            df["enrichment"], categories=enrichments
+        )
+
+        # Fixme: Not all the dates are real dates.  Keep the original strings
+        # so we can hand them back for the ones that aren't.
+        df["raw_date"] = df["date"].astype(str).astype("category")
+        df["date"] = pd.to_datetime(
+            df["raw_date"].astype(str), format="%Y-%m-%d", errors="coerce"
+        )
+        return SampleTable(df)
+
+    @staticmethod
+    def concat(tables: Iterable["SampleTable"]) -> "SampleTable":
+        dfs = [table.df for table in tables]
+        if not dfs:
+            return SampleTable.from_dict({})
+        df = pd.concat(dfs)
+        df = df[~df.index.duplicated()]
+        # Categoricals with different categories concatenate to object.
+        for name in CATEGORICAL_SAMPLE_ATTRIBUTES + ["raw_date"]:
+            if not isinstance(df[name].dtype, pd.CategoricalDtype):
+                df[name] = df[name].astype("category")
+        return SampleTable(df)
+
+    @property
+    def samples(self) -> list[Sample]:
+        return list(self.df.index)
+
+    def select(
+        self,
+        samples: Optional[Iterable[Sample]] = None,
+        enrichment: Optional[Enrichment] = None,
+    ) -> "SampleTable":
+        """Rows for the given samples, in order, optionally by enrichment."""
+        df = self.df if samples is None else self.df.loc[list(samples)]
+        if enrichment:
+            df = df[df["enrichment"] == enrichment.value]
+        return SampleTable(df)
+
+    def _column(self, name: str) -> list:
+        if name == "date":
+            return [
+                raw if pd.isna(parsed) else parsed.date()
+                for parsed, raw in zip(self.df["date"], self.df["raw_date"])
+            ]
+        if name == "enrichment":
+            return [
+                None if pd.isna(e) else Enrichment(e)
+                for e in self.df["enrichment"]
+            ]
+        if name == "reads":
+            return self.df["reads"].tolist()
+        return [None if pd.isna(v) else v for v in self.df[name]]
+
+    def attributes(self) -> dict[Sample, SampleAttributes]:
+        """SampleAttributes for every row, built column by column."""
+        names = list(SampleAttributes.__fields__)
+        columns = [self._column(name) for name in names]
+        # The columns were validated when the table was built, so skip
+        # validating each object again.
+        return {
+            Sample(sample): SampleAttributes.construct(**dict(zip(names, row)))
+            for sample, row in zip(self.df.index, zip(*columns))
+        }
+
+    def __getitem__(self, sample: Sample) -> SampleAttributes:
+        if sample not in self.df.index:
+            raise KeyError(sample)
+        return self.select([sample]).attributes()[sample]
+
+    def __iter__(self) -> Iterator[Sample]:
+        return iter(self.df.index)
+
+    def __len__(self) -> int:
+        return len(self.df)
+
+    def __contains__(self, sample: object) -> bool:
+        return sample in self.df.index
+
+    def items(self) -> ItemsView[Sample, SampleAttributes]:
+        return self.attributes().items()
+
+
+def parse_sample_attributes(
+    raw: bytes, samples: Optional[Collection[Sample]] = None
+) -> SampleTable:
+    """Parse samples.json, keeping only the given samples if any."""
+    data = json.loads(raw)
+    if samples is not None:
+        data = {s: data[s] for s in samples if s in data}
+    return SampleTable.from_dict(data)
+
+
+def load_sample_attributes(repo: DataSource) -> SampleTable:
+    return parse_sample_attributes(repo.get_file(SAMPLES_PATH))
+
+
+SampleCounts = Mapping[TaxID, Mapping[Sample, int]]
+
+
+@dataclass(eq=False)
+class SampleCountMatrix(Mapping[TaxID, Mapping[Sample, int]]):
+    """Read counts by taxid and sample, stored as a sparse matrix.
+
+    Rows are taxids and columns are samples, in CSR form: the counts for row i
+    are counts[indptr[i]:indptr[i + 1]], and the matching slice of indices
+    holds their columns in ascending order.  Acts as a read-only
+    SampleCounts, where each row is a view on the underlying arrays.
+    """
+
+    taxids: np.ndarray  # int64, one per row
+    samples: list[Sample]  # one per column
+    indptr: np.ndarray  # int64, len(taxids) + 1
+    indices: np.ndarray  # int32, column of each nonzero entry
+    counts: np.ndarray  # integer, value of each nonzero entry
+    # Row and column numbers, which are also the ids of taxids and samples.
+    taxid_ids: Interner[TaxID] = field(init=False, repr=False)
+    sample_ids: Interner[Sample] = field(init=False, repr=False)
+
+    def __post_init__(self) -> None:
+        self.taxid_ids = Interner(
+            [TaxID(taxid) for taxid in self.taxids.tolist()]
+        )
+        self.sample_ids = Interner(self.samples)
+
+    @staticmethod
+    def from_dict(data: SampleCounts) -> "SampleCountMatrix":
+        sample_ids: Interner[Sample] = Interner()
+        taxids = []
+        indptr = [0]
+        indices = []
+        counts = []
+        for taxid, sample_counts in data.items():
+            taxids.append(taxid)
+            for sample, n in sample_counts.items():
+                indices.append(sample_ids.intern(sample))
+                counts.append(n)
+            indptr.append(len(indices))
+        indptr_array = np.array(indptr, dtype=np.int64)
+        indices_array = np.array(indices, dtype=np.int32)
+        counts_array = np.array(counts, dtype=np.int32)
+        # Columns were numbered in order of first appearance; sort each row.
+        rows = np.repeat(
+            np.arange(len(taxids), dtype=np.int32), np.diff(indptr_array)
+        )
+        order = np.lexsort((indices_array, rows))
+        return SampleCountMatrix(
+            taxids=np.array(taxids, dtype=np.int64),
+            samples=sample_ids.values,
+            indptr=indptr_array,
+            indices=indices_array[order],
+            counts=counts_array[order],
+        )
+
+    def row(self, taxid: TaxID) -> tuple[np.ndarray, np.ndarray]:
+        """Columns and counts of the nonzero entries for taxid."""
+        return self.row_at(self.taxid_ids.ids[taxid])
+
+    def row_at(self, i: int) -> tuple[np.ndarray, np.ndarray]:
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.counts[start:end]
+
+    def __getitem__(self, taxid: TaxID) -> "SampleCountRow":
+        columns, counts = self.row(taxid)
+        return SampleCountRow(self, columns, counts)
+
+    def __iter__(self) -> Iterator[TaxID]:
+        return iter(self.taxid_ids.values)
+
+    def __len__(self) -> int:
+        return len(self.taxids)
+
+    def __contains__(self, taxid: object) -> bool:
+        return taxid in self.taxid_ids
+
+
+@dataclass(eq=False)
+class SampleCountRow(Mapping[Sample, int]):
+    matrix: SampleCountMatrix
+    columns: np.ndarray
+    counts: np.ndarray
+
+    def __getitem__(self, sample: Sample) -> int:
+        column = self.matrix.sample_ids.ids[sample]
+        i = np.searchsorted(self.columns, column)
+        if i == len(self.columns) or self.columns[i] != column:
+            raise KeyError(sample)
+        return int(self.counts[i])
+
+    def __iter__(self) -> Iterator[Sample]:
+        return (self.matrix.samples[c] for c in self.columns)
 
+    def __len__(self) -> int:
+        return len(self.columns)
 
-SampleCounts = dict[TaxID, dict[Sample, int]]
 
+def parse_sample_counts(
+    raw: bytes, samples: Optional[Collection[Sample]] = None
+) -> SampleCountMatrix:
+    """Parse sample counts, keeping only the given samples if any.
 
-def load_sample_counts(repo: GitHubRepo) -> SampleCounts:
-    data: dict[str, dict[str, int]] = json.loads(
-        repo.get_file("dashboard/human_virus_sample_counts.json")
+    Every taxid keeps its row, even if none of its samples are kept.
+    """
+    data: dict[str, dict[Sample, int]] = json.loads(raw)
+    if samples is not None:
+        samples = set(samples)
+        data = {
+            taxid: {s: n for s, n in counts.items() if s in samples}
+            for taxid, counts in data.items()
+        }
+    return SampleCountMatrix.from_dict(
+        {TaxID(int(taxid)): counts for taxid, counts in data.items()}
     )
-    return {
-        TaxID(int(taxid)): {Sample(sample): n for sample, n in counts.items()}
-        for taxid, counts in data.items()
-    }
 
 
-def load_tax_tree(repo: GitHubRepo) -> Tree[TaxID]:
-    data = json.loads(repo.get_file("dashboard/human_virus_tree.json"))
+def load_sample_counts(repo: DataSource) -> SampleCountMatrix:
+    return parse_sample_counts(repo.get_file(SAMPLE_COUNTS_PATH))
+
+
+def parse_tax_tree(raw: bytes) -> Tree[TaxID]:
+    data = json.loads(raw)
     return Tree.tree_from_list(data).map(lambda x: TaxID(int(x)))
 
 
+def load_tax_tree(repo: DataSource) -> Tree[TaxID]:
+    return parse_tax_tree(repo.get_file(TAX_TREE_PATH))
+
+
+@dataclass
+class LoadTiming:
+    path: str
+    fetch_seconds: float
+    parse_seconds: float
+
+
+def _timed_load(
+    repo: DataSource, path: str, parse: Callable[[bytes], T]
+) -> tuple[T, LoadTiming]:
+    start = time.perf_counter()
+    raw = repo.get_file(path)
+    fetched = time.perf_counter()
+    parsed = parse(raw)
+    timing = LoadTiming(
+        path=path,
+        fetch_seconds=fetched - start,
+        parse_seconds=time.perf_counter() - fetched,
+    )
+    logger.info(
+        "%s: fetched in %.3fs, parsed in %.3fs",
+        path,
+        timing.fetch_seconds,
+        timing.parse_seconds,
+    )
+    return parsed, timing
+
+
 def make_count_tree(
     taxtree: Tree[TaxID], sample_counts: SampleCounts
 ) -> Tree[tuple[TaxID, Counter[Sample]]]:
@@ -114,67 +678,502 @@ def make_count_tree(
     )
 
 
+def make_pruned_count_tree(
+    taxtree: FlatTree[TaxID],
+    sample_counts: SampleCounts,
+    samples: Collection[Sample],
+) -> Optional[Tree[tuple[TaxID, Counter[Sample]]]]:
+    """Like make_count_tree, but only counting reads from samples.
+
+    Keeps just the taxids with reads in those samples, and their ancestors,
+    so it's sized by the observed data rather than the whole taxonomy.  None
+    if there aren't any reads.
+    """
+    if not isinstance(sample_counts, SampleCountMatrix):
+        sample_counts = SampleCountMatrix.from_dict(sample_counts)
+    columns = sample_counts.sample_ids.lookup(samples)
+    wanted = np.zeros(len(sample_counts.samples), dtype=bool)
+    wanted[columns[columns >= 0]] = True
+    observed = wanted[sample_counts.indices] & (sample_counts.counts > 0)
+    rows = np.repeat(
+        np.arange(len(sample_counts.taxids)), np.diff(sample_counts.indptr)
+    )
+
+    counts: dict[TaxID, Counter[Sample]] = {}
+    for row in np.unique(rows[observed]).tolist():
+        row_columns, row_counts = sample_counts.row_at(row)
+        start = sample_counts.indptr[row]
+        mask = observed[start : start + len(row_columns)]
+        counts[TaxID(int(sample_counts.taxids[row]))] = Counter(
+            {
+                sample_counts.samples[c]: n
+                for c, n in zip(
+                    row_columns[mask].tolist(), row_counts[mask].tolist()
+                )
+            }
+        )
+    nodes = taxtree.nodes(np.array(list(counts), dtype=np.int64))
+    if not (nodes >= 0).any():
+        return None
+    return (
+        taxtree.prune(nodes[nodes >= 0])
+        .to_tree()
+        .map(lambda taxid: (taxid, counts.get(taxid, Counter())))
+    )
+
+
 def count_reads(
     taxtree: Tree[TaxID] | None, sample_counts: SampleCounts
 ) -> Counter[Sample]:
     if taxtree is None:
         return Counter()
-    count_tree = make_count_tree(taxtree, sample_counts)
-    return sum(
-        (elem.data[1] for elem in count_tree),
-        start=Counter(),
+    # Accumulate into a single Counter; summing a Counter per node copies the
+    # running total at every step.
+    total: Counter[Sample] = Counter()
+    for node in taxtree:
+        if node.data in sample_counts:
+            total.update(sample_counts[node.data])
+    return total
+
+
+def build_clade_counts(
+    taxtree: Tree[TaxID], sample_counts: SampleCounts
+) -> SampleCountMatrix:
+    """Clade-inclusive read counts for every node in taxtree.
+
+    Row t is the total of sample_counts over the subtree rooted at t, with the
+    same columns as sample_counts.  Computed in one bottom-up pass, where each
+    node's row is its own counts plus its children's clade rows.
+    """
+    if not isinstance(sample_counts, SampleCountMatrix):
+        sample_counts = SampleCountMatrix.from_dict(sample_counts)
+    empty = np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+
+    nodes = list(taxtree)  # Preorder, so reversed visits children first.
+    clade_rows: dict[int, tuple[np.ndarray, np.ndarray]] = {}
+    for node in reversed(nodes):
+        parts = [clade_rows[id(child)] for child in node.children]
+        if node.data in sample_counts:
+            parts.append(sample_counts.row(node.data))
+        parts = [part for part in parts if len(part[0])]
+        if not parts:
+            clade_rows[id(node)] = empty
+        elif len(parts) == 1:
+            clade_rows[id(node)] = parts[0]
+        else:
+            columns, inverse = np.unique(
+                np.concatenate([columns for columns, _ in parts]),
+                return_inverse=True,
+            )
+            counts = np.bincount(
+                inverse,
+                weights=np.concatenate([counts for _, counts in parts]),
+                minlength=len(columns),
+            )
+            clade_rows[id(node)] = columns, counts.astype(np.int64)
+
+    rows = [clade_rows[id(node)] for node in nodes]
+    return SampleCountMatrix(
+        taxids=np.array([node.data for node in nodes], dtype=np.int64),
+        samples=sample_counts.samples,
+        indptr=np.concatenate(
+            [[0], np.cumsum([len(columns) for columns, _ in rows])]
+        ).astype(np.int64),
+        indices=np.concatenate([columns for columns, _ in rows]).astype(
+            np.int32
+        ),
+        counts=np.concatenate([counts for _, counts in rows]).astype(np.int64),
     )
 
 
+@dataclass
+class UnloadedSamples:
+    """The sample attributes behind a lazily loaded MGSData.
+
+    Read counts are compact once parsed, so those are loaded up front.  The
+    sample attributes are kept as compressed JSON, which is much smaller than
+    the table it parses into, and parsed out a batch of samples at a time.
+    """
+
+    sample_attrs: bytes  # zlib-compressed
+    loaded: set[Sample] = field(default_factory=set)
+
+    def load(self, samples: Collection[Sample]) -> SampleTable:
+        """Index samples, none of which have been loaded before."""
+        self.loaded.update(samples)
+        return parse_sample_attributes(
+            zlib.decompress(self.sample_attrs), samples
+        )
+
+
+def _compressed(raw: bytes) -> bytes:
+    return zlib.compress(raw, 1)
+
+
+# Bump when the layout written by MGSData.save changes.
+SNAPSHOT_VERSION = 1
+
+
 @dataclass
 class MGSData:
     bioprojects: dict[BioProject, list[Sample]]
-    sample_attrs: dict[Sample, SampleAttributes]
+    sample_attrs: SampleTable
     read_counts: SampleCounts
     tax_tree: Tree[TaxID]
+    # How long each file took to fetch and parse, when loaded from a source.
+    load_timings: list[LoadTiming] = field(
+        default_factory=list, compare=False, repr=False
+    )
+    # When loaded lazily, the sample attributes we haven't indexed yet.
+    unloaded: Optional["UnloadedSamples"] = field(
+        default=None, compare=False, repr=False
+    )
 
     @staticmethod
     def from_repo(
         user=MGS_REPO_DEFAULTS["user"],
         repo=MGS_REPO_DEFAULTS["repo"],
         ref=MGS_REPO_DEFAULTS["ref"],
+        cache_dir: Optional[Path] | Default = Default.DEFAULT,
+        offline: Optional[bool] = None,
+        bioprojects: Optional[Iterable[BioProject]] = None,
     ):
-        repo = GitHubRepo(user, repo, ref)
+        """Load from GitHub; cache_dir=None disables caching."""
+        return MGSData.from_source(
+            GitHubRepo(
+                user,
+                repo,
+                ref,
+                cache_dir=(
+                    default_cache_dir()
+                    if cache_dir is Default.DEFAULT
+                    else cache_dir
+                ),
+                offline=default_offline() if offline is None else offline,
+            ),
+            bioprojects=bioprojects,
+        )
+
+    @staticmethod
+    def from_source(
+        source: DataSource, bioprojects: Optional[Iterable[BioProject]] = None
+    ) -> "MGSData":
+        """Load everything from source.
+
+        If bioprojects is given, only index the attributes of samples from
+        those bioprojects; the rest are indexed on first use.
+        """
+        if bioprojects is not None:
+            return MGSData._from_source_lazy(source, bioprojects)
+        # Fetch all the files concurrently, one connection each, and parse
+        # each one as soon as it arrives.
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            bioprojects_f = executor.submit(
+                _timed_load, source, BIOPROJECTS_PATH, parse_bioprojects
+            )
+            sample_attrs = executor.submit(
+                _timed_load, source, SAMPLES_PATH, parse_sample_attributes
+            )
+            read_counts = executor.submit(
+                _timed_load, source, SAMPLE_COUNTS_PATH, parse_sample_counts
+            )
+            tax_tree = executor.submit(
+                _timed_load, source, TAX_TREE_PATH, parse_tax_tree
+            )
+        return MGSData(
+            bioprojects=bioprojects_f.result()[0],
+            sample_attrs=sample_attrs.result()[0],
+            read_counts=read_counts.result()[0],
+            tax_tree=tax_tree.result()[0],
+            load_timings=[
+                bioprojects_f.result()[1],
+                sample_attrs.result()[1],
+                read_counts.result()[1],
+                tax_tree.result()[1],
+            ],
+        )
+
+    @staticmethod
+    def _from_source_lazy(
+        source: DataSource, bioprojects: Iterable[BioProject]
+    ) -> "MGSData":
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            bioprojects_f = executor.submit(
+                _timed_load, source, BIOPROJECTS_PATH, parse_bioprojects
+            )
+            sample_attrs = executor.submit(
+                _timed_load, source, SAMPLES_PATH, _compressed
+            )
+            read_counts = executor.submit(
+                _timed_load, source, SAMPLE_COUNTS_PATH, parse_sample_counts
+            )
+            tax_tree = executor.submit(
+                _timed_load, source, TAX_TREE_PATH, parse_tax_tree
+            )
+        all_bioprojects = bioprojects_f.result()[0]
+        start = time.perf_counter()
+        unloaded = UnloadedSamples(sample_attrs.result()[0])
+        indexed_attrs = unloaded.load(
+            {s for bp in bioprojects for s in all_bioprojects[bp]}
+        )
+        data = MGSData(
+            bioprojects=all_bioprojects,
+            sample_attrs=indexed_attrs,
+            read_counts=read_counts.result()[0],
+            tax_tree=tax_tree.result()[0],
+            load_timings=[
+                bioprojects_f.result()[1],
+                sample_attrs.result()[1],
+                read_counts.result()[1],
+                tax_tree.result()[1],
+            ],
+            unloaded=unloaded,
+        )
+        logger.info(
+            "Indexed %d samples in %.3fs",
+            len(unloaded.loaded),
+            time.perf_counter() - start,
+        )
+        return data
+
+    def ensure_loaded(self, bioprojects: Iterable[BioProject]) -> None:
+        """Index the samples of bioprojects, if this data is lazy."""
+        if self.unloaded is None:
+            return
+        new_samples = {
+            s for bp in bioprojects for s in self.bioprojects[bp]
+        } - self.unloaded.loaded
+        if not new_samples:
+            return
+        self.sample_attrs = SampleTable.concat(
+            [self.sample_attrs, self.unloaded.load(new_samples)]
+        )
+
+    def save(self, path: Path | str) -> None:
+        """Write a binary snapshot of this data to the directory path.
+
+        Every array is written as its own .npy file so MGSData.load can
+        memory-map them.  Strings are stored once each, in per-column
+        dictionaries, and referenced by integer codes everywhere else.
+        """
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        self.ensure_loaded(self.bioprojects)
+        read_counts = self.read_counts
+        if not isinstance(read_counts, SampleCountMatrix):
+            read_counts = SampleCountMatrix.from_dict(read_counts)
+        df = self.sample_attrs.df
+
+        # All the samples we refer to, in one dictionary.
+        samples = list(
+            dict.fromkeys(
+                [
+                    *df.index,
+                    *read_counts.samples,
+                    *(s for bp in self.bioprojects.values() for s in bp),
+                ]
+            )
+        )
+        sample_codes = {s: i for i, s in enumerate(samples)}
+
+        def encode_samples(values: Iterable[Sample]) -> np.ndarray:
+            return np.array([sample_codes[s] for s in values], dtype=np.int32)
+
+        arrays = {
+            "samples": np.array(samples, dtype=str),
+            "bioprojects": np.array(list(self.bioprojects), dtype=str),
+            "bioprojects.indptr": np.cumsum(
+                [0] + [len(bp) for bp in self.bioprojects.values()],
+                dtype=np.int64,
+            ),
+            "bioprojects.samples": encode_samples(
+                s for bp in self.bioprojects.values() for s in bp
+            ),
+            "table.samples": encode_samples(df.index),
+            "table.date": df["date"].to_numpy(),
+            "table.reads": df["reads"].to_numpy(dtype=np.int64),
+            "table.enrichment": df["enrichment"].cat.codes.to_numpy(),
+            "counts.taxids": read_counts.taxids,
+            "counts.samples": encode_samples(read_counts.samples),
+            "counts.indptr": read_counts.indptr,
+            "counts.indices": read_counts.indices,
+            "counts.counts": read_counts.counts,
+        }
+        for name in CATEGORICAL_SAMPLE_ATTRIBUTES + ["raw_date"]:
+            column = df[name].cat
+            arrays[f"table.{name}"] = column.codes.to_numpy()
+            arrays[f"table.{name}.categories"] = np.array(
+                column.categories, dtype=str
+            )
+        taxids, parents = self.tax_tree.to_preorder()
+        arrays["tree.taxids"] = np.array(taxids, dtype=np.int64)
+        arrays["tree.parents"] = np.array(parents, dtype=np.int32)
+
+        for name, array in arrays.items():
+            np.save(path / f"{name}.npy", array, allow_pickle=False)
+        (path / "manifest.json").write_text(
+            json.dumps({"version": SNAPSHOT_VERSION, "arrays": list(arrays)})
+        )
+
+    @staticmethod
+    def load(path: Path | str, mmap: bool = True) -> "MGSData":
+        """Read a snapshot written by MGSData.save.
+
+        With mmap the arrays are memory-mapped rather than read, so the
+        read counts are only paged in as they're used.
+        """
+        path = Path(path)
+        manifest = json.loads((path / "manifest.json").read_text())
+        if manifest["version"] != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"Snapshot {path} has version {manifest['version']}, "
+                f"expected {SNAPSHOT_VERSION}"
+            )
+
+        def array(name: str) -> np.ndarray:
+            return np.load(
+                path / f"{name}.npy",
+                mmap_mode="r" if mmap else None,
+                allow_pickle=False,
+            )
+
+        samples = [Sample(s) for s in array("samples").tolist()]
+
+        def decode_samples(codes: np.ndarray) -> list[Sample]:
+            return [samples[i] for i in codes.tolist()]
+
+        bioproject_samples = decode_samples(array("bioprojects.samples"))
+        indptr = array("bioprojects.indptr").tolist()
+        bioprojects = {
+            BioProject(bp): bioproject_samples[start:end]
+            for bp, start, end in zip(
+                array("bioprojects").tolist(), indptr, indptr[1:]
+            )
+        }
+
+        columns: dict[str, object] = {
+            name: pd.Categorical.from_codes(
+                array(f"table.{name}"),
+                categories=pd.Index(array(f"table.{name}.categories")),
+            )
+            for name in CATEGORICAL_SAMPLE_ATTRIBUTES + ["raw_date"]
+        }
+        columns["date"] = array("table.date")
+        columns["reads"] = array("table.reads")
+        columns["enrichment"] = pd.Categorical.from_codes(
+            array("table.enrichment"),
+            categories=pd.Index([e.value for e in Enrichment]),
+        )
+        df = pd.DataFrame(
+            columns,
+            index=pd.Index(
+                decode_samples(array("table.samples")), name="sample"
+            ),
+        )[list(SampleAttributes.__fields__) + ["raw_date"]]
+
         return MGSData(
-            bioprojects=load_bioprojects(repo),
-            sample_attrs=load_sample_attributes(repo),
-            read_counts=load_sample_counts(repo),
-            tax_tree=load_tax_tree(repo),
+            bioprojects=bioprojects,
+            sample_attrs=SampleTable(df),
+            read_counts=SampleCountMatrix(
+                taxids=array("counts.taxids"),
+                samples=decode_samples(array("counts.samples")),
+                indptr=array("counts.indptr"),
+                indices=array("counts.indices"),
+                counts=array("counts.counts"),
+            ),
+            tax_tree=Tree.from_preorder(
+                [TaxID(t) for t in array("tree.taxids").tolist()],
+                array("tree.parents").tolist(),
+            ),
+        )
+
+    def sample_table(
+        self, bioproject: BioProject, enrichment: Optional[Enrichment] = None
+    ) -> SampleTable:
+        self.ensure_loaded([bioproject])
+        return self.sample_attrs.select(
+            self.bioprojects[bioproject], enrichment
         )
 
     def sample_attributes(
         self, bioproject: BioProject, enrichment: Optional[Enrichment] = None
     ) -> dict[Sample, SampleAttributes]:
-        samples = {
-            s: self.sample_attrs[s] for s in self.bioprojects[bioproject]
-        }
-        if enrichment:
-            return {
-                s: attrs
-                for s, attrs in samples.items()
-                if attrs.enrichment == enrichment
-            }
-        else:
-            return samples
+        return self.sample_table(bioproject, enrichment).attributes()
 
     def total_reads(self, bioproject: BioProject) -> dict[Sample, int]:
+        table = self.sample_table(bioproject)
+        return dict(zip(table.samples, table.df["reads"].tolist()))
+
+    @cached_property
+    def clade_counts(self) -> SampleCountMatrix:
+        """Clade-inclusive read counts for every taxid in tax_tree."""
+        return build_clade_counts(self.tax_tree, self.read_counts)
+
+    @cached_property
+    def flat_tax_tree(self) -> FlatTree[TaxID]:
+        return FlatTree.from_tree(self.tax_tree)
+
+    def count_tree(
+        self,
+        bioprojects: Iterable[BioProject],
+        enrichment: Optional[Enrichment] = None,
+    ) -> Optional[Tree[tuple[TaxID, Counter[Sample]]]]:
+        """Read counts by taxid for these bioprojects' samples.
+
+        Only includes the taxids with reads, and their ancestors; see
+        make_pruned_count_tree.
+        """
+        samples = [
+            sample
+            for bioproject in bioprojects
+            for sample in self.sample_table(bioproject, enrichment).samples
+        ]
+        return make_pruned_count_tree(
+            self.flat_tax_tree, self.read_counts, samples
+        )
+
+    def tracked_clades(
+        self, taxids: Iterable[TaxID] | np.ndarray, tracked: Collection[TaxID]
+    ) -> np.ndarray:
+        """The nearest tracked taxid at or above each taxid, or -1.
+
+        For example tracked could be pathogens.tracked_taxids().
+        """
+        if not isinstance(taxids, np.ndarray):
+            taxids = np.fromiter(taxids, dtype=np.int64)
+        return self.flat_tax_tree.resolve(taxids, tracked)
+
+    @cached_property
+    def sample_ids(self) -> Interner[Sample]:
+        """Ids for every sample, matching the columns of clade_counts."""
+        sample_ids = Interner(self.clade_counts.samples)
+        for samples in self.bioprojects.values():
+            sample_ids.intern_all(samples)
+        return sample_ids
+
+    @cached_property
+    def bioproject_ids(self) -> dict[BioProject, np.ndarray]:
+        """Sample ids of each bioproject, in the order of bioprojects."""
         return {
-            s: self.sample_attrs[s].reads for s in self.bioprojects[bioproject]
+            bioproject: self.sample_ids.lookup(samples)
+            for bioproject, samples in self.bioprojects.items()
         }
 
+    def clade_totals(self, taxids: Iterable[TaxID]) -> np.ndarray:
+        """Reads assigned to any of the taxids' clades, by sample id."""
+        clade_counts = self.clade_counts
+        totals = np.zeros(len(self.sample_ids), dtype=np.int64)
+        for row in clade_counts.taxid_ids.lookup(taxids).tolist():
+            if row >= 0:
+                # Columns are unique within a row, so this doesn't need
+                # np.add.at.
+                columns, counts = clade_counts.row_at(row)
+                totals[columns] += counts
+        return totals
+
     def viral_reads(
         self, bioproject: BioProject, taxids: Iterable[TaxID]
     ) -> dict[Sample, int]:
-        viral_counts_by_taxid = {
-            taxid: count_reads(self.tax_tree[taxid], self.read_counts)
-            for taxid in taxids
-        }
-        return {
-            s: sum(viral_counts_by_taxid[taxid][s] for taxid in taxids)
-            for s in self.bioprojects[bioproject]
-        }
+        self.ensure_loaded([bioproject])
+        totals = self.clade_totals(taxids)[self.bioproject_ids[bioproject]]
+        return dict(zip(self.bioprojects[bioproject], totals.tolist()))
@@ -1,14 +1,15 @@
 import abc
 import calendar
+import contextlib
 import dataclasses
 import datetime
+import functools
 import itertools
 import os.path
-import re
-from collections.abc import Iterable
+from collections.abc import Iterable, Iterator, Sequence
 from dataclasses import InitVar, dataclass, field
 from enum import Enum
-from typing import NewType, Optional
+from typing import Any, NewType, Optional, TypeVar, overload
 
 import numpy as np
 
@@ -80,23 +81,103 @@ def days_in_month(year: int, month: int) -> int:
     return last_day
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
-class Variable:
-    """An external piece of data"""
+# A date as YYYY, YYYY-MM, or YYYY-MM-DD, an already parsed date, or a
+# proleptic Gregorian ordinal (date.toordinal()).
+DateSpec = str | datetime.date | int
+
+
+def parse_date(date: DateSpec, start_or_end: str) -> datetime.date:
+    """The first or last day of the period date refers to."""
+    if isinstance(date, datetime.date):
+        return date
+    if isinstance(date, int):
+        return datetime.date.fromordinal(date)
+    return _parse_date_string(date, start_or_end)
+
+
+# Most dates repeat, across estimates and between start and end.
+@functools.lru_cache(maxsize=8192)
+def _parse_date_string(date: str, start_or_end: str) -> datetime.date:
+    if start_or_end not in ("start", "end"):
+        raise ValueError(start_or_end)
+    if not (date.isascii() and len(date) in (4, 7, 10)):
+        raise Exception("Unknown date format %s" % date)
+    parts = date.split("-")
+    if [len(part) for part in parts] not in ([4], [4, 2], [4, 2, 2]) or not (
+        all(part.isdigit() for part in parts)
+    ):
+        raise Exception("Unknown date format %s" % date)
+
+    y = int(parts[0])
+    if len(parts) > 1:
+        m = int(parts[1])
+    else:
+        m = 1 if start_or_end == "start" else 12
+    if len(parts) > 2:
+        d = int(parts[2])
+    elif start_or_end == "start":
+        d = 1
+    else:
+        d = days_in_month(y, m)
+    return datetime.date(y, m, d)
+
+
+@dataclass(frozen=True, slots=True)
+class VariableMetadata:
+    """Where a Variable came from.
+
+    Rarely read, and usually the same for many variables, so it's kept in a
+    shared table instead of on each Variable.
+    """
 
     source: Optional[str] = None
-    country: Optional[str] = None
-    state: Optional[str] = None
-    county: Optional[str] = None
     number_of_participants: Optional[int] = None
     confidence_interval: Optional[tuple[float, float]] = None
     coverage_probability: Optional[float] = None
     methods: Optional[str] = None
+
+
+_metadata_table: dict[VariableMetadata, VariableMetadata] = {}
+
+_field_names_by_class: dict[type, tuple[str, ...]] = {}
+
+
+def _field_names(cls: type) -> tuple[str, ...]:
+    if cls not in _field_names_by_class:
+        _field_names_by_class[cls] = tuple(
+            f.name for f in dataclasses.fields(cls) if f.compare
+        )
+    return _field_names_by_class[cls]
+
+
+# Variables are immutable and often hashed: they go in sets of inputs and
+# are used as dict keys.  So Variable computes its hash once, at
+# construction, and compares by identity or hash before comparing fields.
+# Subclasses must use eq=False to inherit these instead of having
+# dataclass generate field-by-field versions.
+#
+# There are a lot of Variables, so they use slots; subclasses need
+# slots=True too.
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
+class Variable:
+    """An external piece of data"""
+
+    country: Optional[str] = None
+    state: Optional[str] = None
+    county: Optional[str] = None
+    # These are stored in metadata.
+    source: InitVar[Optional[str]] = None
+    number_of_participants: InitVar[Optional[int]] = None
+    confidence_interval: InitVar[Optional[tuple[float, float]]] = None
+    coverage_probability: InitVar[Optional[float]] = None
+    methods: InitVar[Optional[str]] = None
+    metadata: Optional[VariableMetadata] = None
     # Either supply date, or start_date and end_date.
-    # Dates can be any of: YYYY, YYYY-MM, or YYYY-MM-DD.
-    date: InitVar[Optional[str]] = None
-    start_date: InitVar[Optional[str]] = None
-    end_date: InitVar[Optional[str]] = None
+    # Dates can be any of: YYYY, YYYY-MM, or YYYY-MM-DD.  Bulk loaders can
+    # also pass a datetime.date or an ordinal; see DateSpec.
+    date: InitVar[Optional[DateSpec]] = None
+    start_date: InitVar[Optional[DateSpec]] = None
+    end_date: InitVar[Optional[DateSpec]] = None
     # In cases where an estimate is derived from multiple input variables with
     # different dates, set date_source to the Variable that represents the date
     # range this estimate is intended for.  For example, imagine we have:
@@ -121,20 +202,56 @@ class Variable:
     parsed_end: Optional[datetime.date] = None
     taxid: Optional[TaxID] = None
     inputs: InitVar[Optional[Iterable["Variable"]]] = None
-    all_inputs: set["Variable"] = field(default_factory=set)
+    # The Variables this one was computed from directly, including
+    # date_source and location_source.  Together these form a DAG; read
+    # all_inputs for everything upstream.
+    direct_inputs: tuple["Variable", ...] = ()
     is_pseudocount: Optional[bool] = None
+    _hash: int = field(init=False, repr=False, compare=False)
+    _all_inputs: Optional[frozenset["Variable"]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
 
     def __post_init__(
         self,
-        date: Optional[str],
-        start_date: Optional[str],
-        end_date: Optional[str],
+        source: Optional[str],
+        number_of_participants: Optional[int],
+        confidence_interval: Optional[tuple[float, float]],
+        coverage_probability: Optional[float],
+        methods: Optional[str],
+        date: Optional[DateSpec],
+        start_date: Optional[DateSpec],
+        end_date: Optional[DateSpec],
         date_source: Optional["Variable"],
         location_source: Optional["Variable"],
         inputs: Optional[Iterable["Variable"]],
     ):
         # See comment above about __post_init__ for why we're using
         # __setattr__.
+        if inputs is not None:
+            # May be an iterator, and we read it more than once.
+            inputs = list(inputs)
+
+        metadata: dict[str, Any] = {
+            name: value
+            for name, value in [
+                ("source", source),
+                ("number_of_participants", number_of_participants),
+                ("confidence_interval", confidence_interval),
+                ("coverage_probability", coverage_probability),
+                ("methods", methods),
+            ]
+            if value is not None
+        }
+        if metadata:
+            updated = dataclasses.replace(
+                self.metadata or VariableMetadata(), **metadata
+            )
+            object.__setattr__(
+                self,
+                "metadata",
+                _metadata_table.setdefault(updated, updated),
+            )
         if date and (start_date or end_date):
             raise Exception("If you have start/end don't set date.")
         if self.parsed_start and (date or start_date):
@@ -194,42 +311,73 @@ class Variable:
             object.__setattr__(self, "state", state)
             object.__setattr__(self, "county", county)
 
-        all_inputs = set(self.all_inputs or inputs or [])
+        # dataclasses.replace passes along the original's direct_inputs, and
+        # those take precedence over any new inputs.
+        direct_inputs = dict.fromkeys(self.direct_inputs or inputs or [])
         if date_source:
-            all_inputs.add(date_source)
+            direct_inputs[date_source] = None
         if location_source:
-            all_inputs.add(location_source)
-        for variable in list(all_inputs):
-            all_inputs |= variable.all_inputs
-        object.__setattr__(self, "all_inputs", frozenset(all_inputs))
-
-    def _parse_date(self, date: str, start_or_end: str) -> datetime.date:
-        y, m, d = None, None, None
-        if y_match := re.findall("^(\d\d\d\d)$", date):
-            (y,) = y_match
-        elif ym_match := re.findall("^(\d\d\d\d)-(\d\d)$", date):
-            ((y, m),) = ym_match
-        elif ymd_match := re.findall("^(\d\d\d\d)-(\d\d)-(\d\d)$", date):
-            ((y, m, d),) = ymd_match
-        else:
-            raise Exception("Unknown date format %s" % date)
-
-        y = int(y)
-
-        if m:
-            m = int(m)
-        else:
-            m = {"start": 1, "end": 12}[start_or_end]
+            direct_inputs[location_source] = None
+        # A tuple is much smaller than a frozenset, and with cached hashes
+        # it's just as cheap to hash.
+        object.__setattr__(self, "direct_inputs", tuple(direct_inputs))
+        object.__setattr__(self, "_hash", hash(self._key()))
+
+    def _values(self) -> tuple:
+        return tuple(getattr(self, name) for name in _field_names(type(self)))
+
+    def _key(self) -> tuple:
+        # direct_inputs is stored in order, but which order we were given
+        # our inputs in doesn't make us a different Variable.
+        return tuple(
+            frozenset(value) if name == "direct_inputs" else value
+            for name, value in zip(_field_names(type(self)), self._values())
+        )
 
-        if d:
-            d = int(d)
-        else:
-            if start_or_end == "start":
-                d = 1
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __reduce__(self):
+        # String hashes differ between processes, so recompute the cached
+        # hash on unpickling rather than restoring it.
+        return _unpickle_variable, (type(self), self._values())
+
+    def __eq__(self, other: object) -> bool:
+        if self is other:
+            return True
+        if other.__class__ is not self.__class__:
+            return NotImplemented
+        assert isinstance(other, Variable)
+        return self._hash == other._hash and self._key() == other._key()
+
+    @property
+    def all_inputs(self) -> frozenset["Variable"]:
+        """Every Variable this one was derived from, directly or not.
+
+        Computed on first access, reusing the closure of any input that
+        already has one.
+        """
+        if self._all_inputs is not None:
+            return self._all_inputs
+        closure: set[Variable] = set()
+        seen: set[int] = set()
+        stack = list(self.direct_inputs)
+        while stack:
+            variable = stack.pop()
+            if id(variable) in seen:
+                continue
+            seen.add(id(variable))
+            closure.add(variable)
+            if variable._all_inputs is not None:
+                closure |= variable._all_inputs
             else:
-                d = days_in_month(int(y), int(m))
+                stack.extend(variable.direct_inputs)
+        all_inputs = frozenset(closure)
+        object.__setattr__(self, "_all_inputs", all_inputs)
+        return all_inputs
 
-        return datetime.date(y, m, d)
+    def _parse_date(self, date: DateSpec, start_or_end: str) -> datetime.date:
+        return parse_date(date, start_or_end)
 
     def get_dates(self) -> tuple[datetime.date, datetime.date]:
         assert self.parsed_start
@@ -264,7 +412,16 @@ class Variable:
         )
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
+def _unpickle_variable(cls: type[Variable], values: tuple) -> Variable:
+    variable = cls.__new__(cls)
+    for name, value in zip(_field_names(cls), values):
+        object.__setattr__(variable, name, value)
+    object.__setattr__(variable, "_all_inputs", None)
+    object.__setattr__(variable, "_hash", hash(variable._key()))
+    return variable
+
+
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
 class Taggable(Variable):
     # In cases where the location and date isn't enough to identify the
     # population, you can set a more specific tag to reduce errors.  For
@@ -290,7 +447,7 @@ class Taggable(Variable):
         assert v1.tag == v2.tag
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
 class Scalar(Variable):
     scalar: float
 
@@ -300,11 +457,13 @@ class Scalar(Variable):
 
 
 class Predictor(abc.ABC, Variable):
+    __slots__ = ()
+
     @abc.abstractmethod
     def get_data(self) -> float: ...
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
 class Population(Taggable):
     """A number of people"""
 
@@ -327,7 +486,7 @@ class Population(Taggable):
         )
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
 class Prevalence(Predictor):
     """What fraction of people have this pathogen at some moment"""
 
@@ -399,7 +558,7 @@ class Prevalence(Predictor):
         )
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
 class PrevalenceAbsolute(Taggable):
     """How many people had this pathogen at some moment"""
 
@@ -427,7 +586,7 @@ class PrevalenceAbsolute(Taggable):
         )
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
 class Number(Variable):
     """Generic number.  Use this for weird one-off things
 
@@ -445,7 +604,7 @@ class Number(Variable):
         )
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
 class IncidenceRate(Predictor):
     """What fraction of people get this pathogen annually"""
 
@@ -484,7 +643,7 @@ class IncidenceRate(Predictor):
         )
 
 
-@dataclass(kw_only=True, eq=True, frozen=True)
+@dataclass(kw_only=True, eq=False, frozen=True, slots=True)
 class IncidenceAbsolute(Taggable):
     """How many people get this pathogen annually"""
 
@@ -510,13 +669,392 @@ class IncidenceAbsolute(Taggable):
         )
 
 
+# The field holding each kind of Variable's value, for PredictorTable.
+_value_fields: dict[type[Variable], str] = {
+    IncidenceAbsolute: "annual_infections",
+    IncidenceRate: "annual_infections_per_100k",
+    PrevalenceAbsolute: "infections",
+    Prevalence: "infections_per_100k",
+}
+
+_rate_kinds: dict[type[Variable], type[Variable]] = {
+    IncidenceAbsolute: IncidenceRate,
+    PrevalenceAbsolute: Prevalence,
+}
+
+_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+V = TypeVar("V", bound=Variable)
+
+# A location for every row, or one location for all of them.
+LocationColumn = Optional[str] | Sequence[Optional[str]]
+# A date for every row, or one date for all of them.
+DateColumn = DateSpec | Sequence[DateSpec] | np.ndarray
+
+
+def _years(ordinals: np.ndarray) -> np.ndarray:
+    days = (ordinals - _EPOCH_ORDINAL).astype("datetime64[D]")
+    return days.astype("datetime64[Y]").astype(np.int64) + 1970
+
+
+def _ordinals(dates: DateColumn, start_or_end: str, n: int) -> np.ndarray:
+    if isinstance(dates, np.ndarray) and dates.dtype.kind in "iu":
+        return dates.astype(np.int64)
+    if isinstance(dates, (str, datetime.date, int)):
+        return np.full(
+            n, parse_date(dates, start_or_end).toordinal(), dtype=np.int64
+        )
+    return np.array(
+        [parse_date(date, start_or_end).toordinal() for date in dates],
+        dtype=np.int64,
+    )
+
+
+@dataclass(eq=False)
+class PredictorTable(Sequence[V]):
+    """Many Variables of one kind, stored as columns.
+
+    Time series loaders produce thousands of estimates that differ only in
+    value, date, and location.  A table holds those as arrays, does
+    arithmetic on whole columns, and only builds Variable objects for the
+    rows someone reads.
+
+    Rows are derived the same way the equivalent Variable arithmetic would
+    derive them: row i's direct inputs are row i of parent, if any, and
+    operands[operand_ids[i]], if that's not -1.
+    """
+
+    kind: type[V]
+    values: np.ndarray
+    start: np.ndarray  # int64 ordinals
+    end: np.ndarray  # int64 ordinals
+    # Location codes index into locations, where 0 is None.
+    country: np.ndarray  # int32
+    state: np.ndarray  # int32
+    county: np.ndarray  # int32
+    locations: tuple[Optional[str], ...]
+    taxid: np.ndarray  # int64, 0 for none
+    is_pseudocount: np.ndarray  # int8, -1 for None
+    # Fields with the same value for every row, like active or tag.
+    fields: dict[str, Any] = field(default_factory=dict)
+    parent: Optional["PredictorTable"] = None
+    operands: tuple[Variable, ...] = ()
+    operand_ids: Optional[np.ndarray] = None  # int32, -1 for none
+
+    def __post_init__(self) -> None:
+        if self.kind not in _value_fields:
+            raise ValueError(f"Can't store {self.kind.__name__} in a table")
+        if self.operand_ids is None:
+            self.operand_ids = np.full(len(self.values), -1, dtype=np.int32)
+
+    @staticmethod
+    def build(
+        kind: type[V],
+        values: Sequence[float] | np.ndarray,
+        *,
+        date: Optional[DateColumn] = None,
+        start_date: Optional[DateColumn] = None,
+        end_date: Optional[DateColumn] = None,
+        country: LocationColumn = None,
+        state: LocationColumn = None,
+        county: LocationColumn = None,
+        taxid: Optional[TaxID] | Sequence[int] | np.ndarray = None,
+        is_pseudocount: Optional[bool] | Sequence[Optional[bool]] = None,
+        **fields: Any,
+    ) -> "PredictorTable[V]":
+        """Build a table from one value per row.
+
+        Everything else can be given per row or once for every row.  Dates
+        are the same as for Variable, or an integer array of ordinals.
+        """
+        values = np.asarray(values)
+        n = len(values)
+        if date is not None:
+            if start_date is not None or end_date is not None:
+                raise Exception("If you have start/end don't set date.")
+            start_date = end_date = date
+        if start_date is None or end_date is None:
+            raise Exception("Tables need dates")
+        start = _ordinals(start_date, "start", n)
+        end = _ordinals(end_date, "end", n)
+        if (start > end).any():
+            raise Exception("Start date can't be after end date")
+
+        locations: dict[Optional[str], int] = {None: 0}
+
+        def encode(column: LocationColumn) -> np.ndarray:
+            if column is None or isinstance(column, str):
+                code = locations.setdefault(column, len(locations))
+                return np.full(n, code, dtype=np.int32)
+            for name in dict.fromkeys(column):
+                locations.setdefault(name, len(locations))
+            return np.fromiter(
+                map(locations.__getitem__, column), dtype=np.int32, count=n
+            )
+
+        country_codes = encode(country)
+        state_codes = encode(state)
+        county_codes = encode(county)
+
+        if taxid is None or isinstance(taxid, int):
+            taxid = np.full(n, taxid or 0)
+        if is_pseudocount is None or isinstance(is_pseudocount, bool):
+            pseudocount_codes = np.full(
+                n, -1 if is_pseudocount is None else int(is_pseudocount)
+            )
+        else:
+            pseudocount_codes = np.array(
+                [-1 if p is None else int(p) for p in is_pseudocount]
+            )
+        return PredictorTable(
+            kind=kind,
+            values=values,
+            start=start,
+            end=end,
+            country=country_codes,
+            state=state_codes,
+            county=county_codes,
+            locations=tuple(locations),
+            taxid=np.asarray(taxid, dtype=np.int64),
+            is_pseudocount=pseudocount_codes.astype(np.int8),
+            fields=fields,
+        )
+
+    @functools.cached_property
+    def location_codes(self) -> dict[Optional[str], int]:
+        return {name: i for i, name in enumerate(self.locations)}
+
+    def location_code(self, name: Optional[str]) -> int:
+        """The code for name, or -1 if no row is there."""
+        return self.location_codes.get(name, -1)
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    @overload
+    def __getitem__(self, index: int) -> V: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> "PredictorTable[V]": ...
+
+    def __getitem__(self, index: int | slice) -> "V | PredictorTable[V]":
+        if isinstance(index, slice):
+            return self.select(np.arange(len(self))[index])
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        index %= len(self)
+        parent = None if self.parent is None else self.parent[index]
+        return self._row(index, parent)
+
+    def __iter__(self) -> Iterator[V]:
+        # Build each parent row once, in order, instead of recursively
+        # indexing for every row.
+        parents: Iterable[Optional[Variable]] = (
+            itertools.repeat(None) if self.parent is None else self.parent
+        )
+        for i, parent in zip(range(len(self)), parents):
+            yield self._row(i, parent)
+
+    def _row(self, i: int, parent: Optional[Variable]) -> V:
+        assert self.operand_ids is not None
+        direct_inputs = [] if parent is None else [parent]
+        operand_id = self.operand_ids[i]
+        if operand_id >= 0:
+            direct_inputs.append(self.operands[operand_id])
+        taxid = int(self.taxid[i])
+        is_pseudocount = int(self.is_pseudocount[i])
+        return self.kind(
+            **{_value_fields[self.kind]: self.values[i].item()},
+            country=self.locations[self.country[i]],
+            state=self.locations[self.state[i]],
+            county=self.locations[self.county[i]],
+            parsed_start=datetime.date.fromordinal(int(self.start[i])),
+            parsed_end=datetime.date.fromordinal(int(self.end[i])),
+            taxid=TaxID(taxid) if taxid else None,
+            is_pseudocount=(
+                None if is_pseudocount < 0 else bool(is_pseudocount)
+            ),
+            direct_inputs=tuple(direct_inputs),
+            **self.fields,
+        )
+
+    def select(self, rows: np.ndarray) -> "PredictorTable[V]":
+        """The table of just the given rows, by index or boolean mask."""
+        assert self.operand_ids is not None
+        return dataclasses.replace(
+            self,
+            values=self.values[rows],
+            start=self.start[rows],
+            end=self.end[rows],
+            country=self.country[rows],
+            state=self.state[rows],
+            county=self.county[rows],
+            taxid=self.taxid[rows],
+            is_pseudocount=self.is_pseudocount[rows],
+            parent=None if self.parent is None else self.parent.select(rows),
+            operand_ids=self.operand_ids[rows],
+        )
+
+    def get_data(self) -> np.ndarray:
+        """Predictor.get_data() for every row."""
+        if self.kind is IncidenceRate:
+            return self.values / 52
+        if self.kind is Prevalence:
+            return self.values
+        raise TypeError(f"{self.kind.__name__} is not a Predictor")
+
+    def _derive(
+        self,
+        kind: type[Variable],
+        values: np.ndarray,
+        operands: Sequence[Variable],
+        operand_ids: np.ndarray,
+    ) -> "PredictorTable[Any]":
+        # Like the Variable arithmetic this mirrors, results keep dates,
+        # location, and activity, and drop everything else.
+        n = len(self)
+        fields = {
+            name: value
+            for name, value in self.fields.items()
+            if name == "active"
+        }
+        return PredictorTable(
+            kind=kind,
+            values=values,
+            start=self.start,
+            end=self.end,
+            country=self.country,
+            state=self.state,
+            county=self.county,
+            locations=self.locations,
+            taxid=np.zeros(n, dtype=np.int64),
+            is_pseudocount=np.full(n, -1, dtype=np.int8),
+            fields=fields,
+            parent=self,
+            operands=tuple(operands),
+            operand_ids=operand_ids,
+        )
+
+    def __mul__(self, scalar: Scalar) -> "PredictorTable[V]":
+        return self.scale([scalar], np.zeros(len(self), dtype=np.int32))
+
+    def scale(
+        self, scalars: Sequence[Scalar], indices: np.ndarray
+    ) -> "PredictorTable[V]":
+        """Multiply row i by scalars[indices[i]]."""
+        if self.kind is IncidenceAbsolute:
+            # IncidenceAbsolute has no __mul__ either.
+            raise TypeError("Convert to a rate before scaling")
+        operand_ids = np.asarray(indices, dtype=np.int32)
+        if len(operand_ids) != len(self):
+            raise ValueError("Need one scalar per row")
+        factors = np.array([scalar.scalar for scalar in scalars])
+        return self._derive(
+            self.kind,
+            self.values * factors[operand_ids],
+            scalars,
+            operand_ids,
+        )
+
+    def to_rate(
+        self,
+        population: Population | Sequence[Population],
+        indices: Optional[np.ndarray] = None,
+    ) -> "PredictorTable[Any]":
+        """Divide each row by population, or by its own population.
+
+        Rows either get one population each, or with indices, row i gets
+        population[indices[i]].
+        """
+        if self.kind not in _rate_kinds:
+            raise TypeError(f"{self.kind.__name__} is already a rate")
+        if isinstance(population, Population):
+            populations = [population]
+            operand_ids = np.zeros(len(self), dtype=np.int32)
+        elif indices is not None:
+            populations = list(population)
+            operand_ids = np.asarray(indices, dtype=np.int32)
+        else:
+            # Rows usually share populations, so store each one once.
+            ids: dict[int, int] = {}
+            populations = []
+            for p in population:
+                if id(p) not in ids:
+                    ids[id(p)] = len(populations)
+                    populations.append(p)
+            operand_ids = np.array(
+                [ids[id(p)] for p in population], dtype=np.int32
+            )
+        if len(operand_ids) != len(self):
+            raise ValueError("Need one population per row")
+
+        # Vectorized Taggable.assert_comparable.
+        for name in ["country", "state", "county"]:
+            codes = np.array(
+                [self.location_code(getattr(p, name)) for p in populations]
+            )
+            assert (codes[operand_ids] == getattr(self, name)).all()
+        starts, ends = (
+            np.array(
+                [[d.toordinal() for d in p.get_dates()] for p in populations],
+                dtype=np.int64,
+            )
+            .reshape(-1, 2)
+            .T
+        )
+        assert (_years(starts)[operand_ids] == _years(self.start)).all()
+        assert (_years(ends)[operand_ids] == _years(self.end)).all()
+        assert all(p.tag == self.fields.get("tag") for p in populations)
+
+        people = np.array([p.people for p in populations])[operand_ids]
+        return self._derive(
+            _rate_kinds[self.kind],
+            self.values * 100000 / people,
+            populations,
+            operand_ids,
+        )
+
+
+# The prevalence data files read while recording_data_files() is active.
+_data_files_read: Optional[set[str]] = None
+
+
+@contextlib.contextmanager
+def recording_data_files() -> Iterator[set[str]]:
+    """Collect the names of the prevalence data files read in this block."""
+    global _data_files_read
+    outer = _data_files_read
+    data_files: set[str] = set()
+    _data_files_read = data_files
+    try:
+        yield data_files
+    finally:
+        _data_files_read = outer
+        if outer is not None:
+            outer |= data_files
+
+
+def note_data_file(filename: str) -> None:
+    """Record that we're using a prevalence data file.
+
+    prevalence_data_filename calls this, so only call it directly for data
+    that was read earlier and kept in memory.
+    """
+    if _data_files_read is not None:
+        _data_files_read.add(filename)
+
+
 def prevalence_data_filename(filename):
+    note_data_file(filename)
     return os.path.join(os.path.dirname(__file__), "prevalence-data", filename)
 
 
 def by_taxids(
-    pathogen_chars: PathogenChars, predictors: list[Predictor]
-) -> dict[frozenset[TaxID], list[Predictor]]:
+    pathogen_chars: PathogenChars, predictors: Iterable[Predictor]
+) -> dict[frozenset[TaxID], Sequence[Predictor]]:
+    if isinstance(predictors, PredictorTable):
+        return _table_by_taxids(pathogen_chars, predictors)
+
     out: dict[frozenset[TaxID], list[Predictor]] = {}
 
     for predictor in predictors:
@@ -529,7 +1067,29 @@ def by_taxids(
             out[taxids] = []
 
         out[taxids].append(predictor)
-    return out
+    return dict(out)
+
+
+def _table_by_taxids(
+    pathogen_chars: PathogenChars, table: PredictorTable
+) -> dict[frozenset[TaxID], Sequence[Predictor]]:
+    assert pathogen_chars.taxids
+    taxids, first_rows = np.unique(table.taxid, return_index=True)
+    if len(taxids) == 1:
+        # Usually every row is for the same taxids, and there's nothing to
+        # split.
+        groups = [(taxids[0], table)]
+    else:
+        groups = [
+            (taxid, table.select(table.taxid == taxid))
+            for taxid in taxids[np.argsort(first_rows)]
+        ]
+    return {
+        (
+            frozenset([TaxID(int(taxid))]) if taxid else pathogen_chars.taxids
+        ): rows
+        for taxid, rows in groups
+    }
 
 
 # We don't want to predict zero of any pathogen, both because they almost never
@@ -1,21 +1,76 @@
+import concurrent.futures
+import hashlib
 import importlib
+import itertools
 import os
-from typing import Generator, List
+import pickle
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from types import ModuleType
+from typing import Generator, List, Optional
 
-from mgs import TaxID
-from pathogen_properties import Predictor, by_taxids
+import cache
+from pathogen_properties import (
+    Predictor,
+    TaxID,
+    by_taxids,
+    prevalence_data_filename,
+    recording_data_files,
+)
 
-pathogens = {}
-for pathogen_fname in os.listdir(os.path.dirname(__file__)):
-    pathogen_name, ext = os.path.splitext(pathogen_fname)
-    if pathogen_name == "__init__":
-        continue
-    if ext != ".py":
-        continue
 
-    pathogens[pathogen_name] = importlib.import_module(
-        "pathogens.%s" % pathogen_name
-    )
+class PathogenModules(Mapping[str, ModuleType]):
+    """The pathogen modules in this package, by name.
+
+    Modules are found by listing the directory and each is only imported the
+    first time it's looked up, so code that needs one pathogen doesn't pay
+    for loading all of them.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.names: list[str] = []
+        for pathogen_fname in os.listdir(directory):
+            pathogen_name, ext = os.path.splitext(pathogen_fname)
+            if pathogen_name == "__init__":
+                continue
+            if ext != ".py":
+                continue
+            self.names.append(pathogen_name)
+        # Directory order varies between machines.
+        self.names.sort()
+        self.modules: dict[str, ModuleType] = {}
+
+    def __getitem__(self, pathogen_name: str) -> ModuleType:
+        if pathogen_name not in self.modules:
+            if pathogen_name not in self.names:
+                raise KeyError(pathogen_name)
+            self.modules[pathogen_name] = importlib.import_module(
+                "pathogens.%s" % pathogen_name
+            )
+        return self.modules[pathogen_name]
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.names)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __contains__(self, pathogen_name: object) -> bool:
+        return pathogen_name in self.names
+
+
+pathogens = PathogenModules(os.path.dirname(__file__))
+
+
+def tracked_taxids() -> dict[TaxID, str]:
+    """Every taxid we track, including subtaxids, mapped to its pathogen."""
+    tracked = {}
+    for pathogen_name, pathogen in pathogens.items():
+        chars = pathogen.pathogen_chars
+        for taxid in chars.taxids | chars.subtaxids:
+            tracked[taxid] = pathogen_name
+    return tracked
 
 
 def tidy_name(pathogen_name, taxids):
@@ -28,18 +83,222 @@ def tidy_name(pathogen_name, taxids):
         return pathogen_name.replace("_", "-").upper()
 
 
-def predictors_by_taxid() -> (
-    Generator[
-        tuple[str, str, str, frozenset[TaxID], list[Predictor]], None, None
-    ]
-):
+# Estimates are cached on disk, keyed by the code that computes them and
+# checked against the prevalence data files they were computed from.
+# Override the location with P2RA_ESTIMATES_CACHE_DIR, or set it to the empty
+# string to disable caching.
+def default_estimates_cache_dir() -> Optional[Path]:
+    return cache.cache_dir("P2RA_ESTIMATES_CACHE_DIR", "estimates")
+
+
+# Each type of predictor and the pathogen function that estimates it.
+PREDICTOR_TYPES = {
+    "incidence": "estimate_incidences",
+    "prevalence": "estimate_prevalences",
+}
+
+# Code outside the pathogen's own module that estimates depend on.
+SHARED_SOURCES = ["pathogen_properties.py", "populations.py"]
+
+
+@dataclass
+class CachedEstimates:
+    # The size, mtime, and sha256 of every data file the estimates read.
+    data_files: dict[str, tuple[int, int, str]]
+    estimates: dict[str, Sequence[Predictor]]
+
+
+def estimates(
+    pathogen_name: str, cache_dir: Optional[Path] = None
+) -> dict[str, Sequence[Predictor]]:
+    """All of a pathogen's estimates, by predictor type.
+
+    Loaded from the cache if neither the code nor the data they came from
+    has changed, and otherwise computed and cached.
+    """
+    if cache_dir is None:
+        cache_dir = default_estimates_cache_dir()
+    if not cache_dir:
+        return compute_estimates(pathogen_name).estimates
+
+    cache_path = _cache_path(cache_dir, pathogen_name)
+    cached = _read_cached_estimates(cache_path)
+    if cached is None:
+        cached = compute_estimates(pathogen_name)
+        _write_cached_estimates(cache_path, _serialize(cached))
+    return cached.estimates
+
+
+def all_estimates(
+    processes: Optional[int] = None, cache_dir: Optional[Path] = None
+) -> dict[str, dict[str, Sequence[Predictor]]]:
+    """estimates() for every pathogen, in the order of pathogens.
+
+    Pathogens that aren't cached are computed in parallel, in a pool of
+    processes (by default, one per CPU).
+    """
+    if cache_dir is None:
+        cache_dir = default_estimates_cache_dir()
+    results: dict[str, Optional[dict[str, Sequence[Predictor]]]] = {}
+    missing = []
+    for pathogen_name in pathogens:
+        cached = None
+        if cache_dir:
+            cached = _read_cached_estimates(
+                _cache_path(cache_dir, pathogen_name)
+            )
+        # Fill in a placeholder for misses so the order doesn't depend on
+        # what was cached.
+        results[pathogen_name] = cached.estimates if cached else None
+        if cached is None:
+            missing.append(pathogen_name)
+
+    if missing:
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=min(processes or os.cpu_count() or 1, len(missing))
+        ) as executor:
+            for pathogen_name, serialized in zip(
+                missing,
+                executor.map(
+                    _compute_serialized,
+                    missing,
+                    itertools.repeat(cache_dir),
+                ),
+            ):
+                results[pathogen_name] = _deserialize(serialized).estimates
+
+    return {
+        pathogen_name: pathogen_estimates
+        for pathogen_name, pathogen_estimates in results.items()
+        if pathogen_estimates is not None
+    }
+
+
+def _compute_serialized(
+    pathogen_name: str, cache_dir: Optional[Path]
+) -> bytes:
+    # Runs in a worker process.  Estimates go back to the parent as a single
+    # pickle, the same one we cache.  Time series are PredictorTables, which
+    # pickle as a handful of arrays instead of one object per estimate.
+    serialized = _serialize(compute_estimates(pathogen_name))
+    if cache_dir:
+        _write_cached_estimates(
+            _cache_path(cache_dir, pathogen_name), serialized
+        )
+    return serialized
+
+
+def _serialize(cached: CachedEstimates) -> bytes:
+    return pickle.dumps(cached, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def _deserialize(serialized: bytes) -> CachedEstimates:
+    cached = pickle.loads(serialized)
+    assert isinstance(cached, CachedEstimates)
+    return cached
+
+
+def compute_estimates(pathogen_name: str) -> CachedEstimates:
+    with recording_data_files() as data_files:
+        pathogen = pathogens[pathogen_name]
+        computed = {}
+        for predictor_type, function_name in PREDICTOR_TYPES.items():
+            predictors = getattr(pathogen, function_name)()
+            if not isinstance(predictors, Sequence):
+                predictors = list(predictors)
+            computed[predictor_type] = predictors
+    return CachedEstimates(
+        data_files={
+            filename: _data_file_signature(filename)
+            for filename in sorted(data_files)
+        },
+        estimates=computed,
+    )
+
+
+def _cache_path(cache_dir: Path, pathogen_name: str) -> Path:
+    return cache_dir / (
+        "%s-%s.pickle" % (pathogen_name, _source_digest(pathogen_name))
+    )
+
+
+def _source_digest(pathogen_name: str) -> str:
+    package_dir = os.path.dirname(__file__)
+    digest = hashlib.sha256()
+    for path in [os.path.join(package_dir, "%s.py" % pathogen_name)] + [
+        os.path.join(os.path.dirname(package_dir), source)
+        for source in SHARED_SOURCES
+    ]:
+        with open(path, "rb") as inf:
+            digest.update(hashlib.sha256(inf.read()).digest())
+    return digest.hexdigest()
+
+
+def _data_file_signature(filename: str) -> tuple[int, int, str]:
+    with open(prevalence_data_filename(filename), "rb") as inf:
+        stat = os.fstat(inf.fileno())
+        digest = hashlib.sha256(inf.read()).hexdigest()
+    return stat.st_size, stat.st_mtime_ns, digest
+
+
+def _read_cached_estimates(cache_path: Path) -> Optional[CachedEstimates]:
+    try:
+        with open(cache_path, "rb") as inf:
+            cached = _deserialize(inf.read())
+    except FileNotFoundError:
+        return None
+    except Exception:
+        # Truncated, or written by code that has since changed in a way the
+        # source digest doesn't cover (like a new numpy); recompute.
+        return None
+
+    for filename, (size, mtime_ns, digest) in cached.data_files.items():
+        try:
+            stat = os.stat(prevalence_data_filename(filename))
+        except FileNotFoundError:
+            return None
+        # Only read the file if it looks different; a fresh checkout changes
+        # mtimes without changing contents.
+        if (stat.st_size, stat.st_mtime_ns) != (size, mtime_ns):
+            if _data_file_signature(filename)[2] != digest:
+                return None
+    return cached
+
+
+def _write_cached_estimates(cache_path: Path, serialized: bytes) -> None:
+    cache.atomic_write(cache_path, serialized)
+    # Estimates from older versions of the code will never be read again.
+    pathogen_name, _ = cache_path.name.split("-", 1)
+    for stale in cache_path.parent.glob("%s-*.pickle" % pathogen_name):
+        if stale != cache_path:
+            stale.unlink(missing_ok=True)
+
+
+def predictors_by_taxid(
+    processes: int = 1,
+) -> Generator[
+    tuple[str, str, str, frozenset[TaxID], Sequence[Predictor]],
+    None,
+    None,
+]:
+    """Every pathogen's predictors, grouped by type and taxids.
+
+    With processes other than 1, estimates are computed up front in
+    parallel; see all_estimates.
+    """
     pathogen_name: str
     predictor_type: str
-    for pathogen_name, pathogen in pathogens.items():
-        for predictor_type, all_predictors in [
-            ("incidence", pathogen.estimate_incidences()),
-            ("prevalence", pathogen.estimate_prevalences()),
-        ]:
+    by_pathogen: Iterable[tuple[str, dict[str, Sequence[Predictor]]]]
+    if processes == 1:
+        by_pathogen = (
+            (pathogen_name, estimates(pathogen_name))
+            for pathogen_name in pathogens
+        )
+    else:
+        by_pathogen = all_estimates(processes or None).items()
+    for pathogen_name, pathogen_estimates in by_pathogen:
+        pathogen = pathogens[pathogen_name]
+        for predictor_type, all_predictors in pathogen_estimates.items():
             for taxids, predictors in by_taxids(
                 pathogen.pathogen_chars,
                 all_predictors,
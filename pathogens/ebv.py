@@ -1,11 +1,8 @@
 import csv
 import dataclasses
-from collections import Counter
-
-import numpy as np
 
 from pathogen_properties import *
-from populations import us_population
+from populations import population
 
 background = """Epstein-Barr virus (EBV) is a type of  herpes virus that
 infects humans and is known to cause infectious mononucleosis, also known
@@ -26,15 +23,6 @@ pathogen_chars = PathogenChars(
     selection=SelectionRound.ROUND_1,
 )
 
-us_fraction_u18 = Scalar(
-    scalar=0.222,
-    source="https://www.census.gov/quickfacts/fact/table/US/LFE046221#:~:text=%EE%A0%BF-,22.2%25,-Persons%2065%20years",
-)
-us_population_u18 = us_population(year=2022) * us_fraction_u18
-
-us_population_18plus = us_population(year=2022) - us_population_u18
-
-
 uk_seroprevalence_0_to_25 = Prevalence(
     infections_per_100k=0.853 * 100_000,
     # Given very high seroprevalence, and lifetime persistence of EBV, we
@@ -49,59 +37,6 @@ uk_seroprevalence_0_to_25 = Prevalence(
 )
 
 
-CENSUS_QUERY = "https://data.census.gov/table?q=Annual+Estimates+of+the+Resident+Population+by+Single+Year"
-
-
-race_cohorts: dict[str, dict[str, int]] = {
-    "black_age_cohorts": {},
-    "latino_age_cohorts": {},
-    "white_age_cohorts": {},
-}
-
-
-digit_extractor = re.compile("\d+")
-
-for race, cohort_dict in race_cohorts.items():
-    with open(prevalence_data_filename(f"{race}.csv")) as inf:
-        # Data is downloaded from this results page: "https://data.census.gov/table?q=Annual+Estimates+of+the+Resident+Population+by+Single+Year&g=010XX00US&tid=DECENNIALDHC2020.PCT12A".
-        # Specifically, we used PCT12I (White alone, not Hispanic or Latino),
-        # PCT12H (Hispanic or Latino), and PCT12B (Black or African American
-        # Alone), saved as [white, latino, black]_age_cohorts.csv.
-        reader = csv.reader(inf)
-
-        # Skip first two non-age lines
-        next(reader)
-        next(reader)
-
-        for row in reader:
-            cohort_age = row[0]
-            number = int(row[1].replace(",", ""))
-
-            # Check if the row is a gender specification row
-            if cohort_age.strip() in ["Male:", "Female:"]:
-                continue
-
-            # Set cohort_age to '0' for 'Under 1 year' label
-            if cohort_age.strip() == "Under 1 year":
-                cohort_age = "0"
-            else:
-                # Extract all integers and take the first one as age.
-                age_digits = digit_extractor.findall(cohort_age)
-                cohort_age = age_digits[0] if age_digits else None
-
-            if cohort_age is not None:
-                if int(cohort_age) <= 18:
-                    if cohort_age in cohort_dict:
-                        cohort_dict[cohort_age] += number
-                    else:
-                        cohort_dict[cohort_age] = number
-                else:
-                    if "adults" in cohort_dict:
-                        cohort_dict["adults"] += number
-                    else:
-                        cohort_dict["adults"] = number
-
-
 EBV_US_2003_2010_SEROPREVALENCE = "https://academic.oup.com/jid/article/208/8/1286/2192838#:~:text=Table%201.Demographic%20Factors%20Associated%20With%20Epstein%E2%80%93Barr%20Virus%20(EBV)%20Antibody%20(Ab)%20Prevalence%2C%20by%20Race/Ethnicity%E2%80%94National%20Health%20and%20Nutrition%20Examination%20Survey%20Cycles%202003%E2%80%932004%2C%202005%E2%80%932006%2C%202007%E2%80%932008%2C%20and%202009%E2%80%932010"
 
 
@@ -119,9 +54,9 @@ def us_seroprevalence_2020() -> Prevalence:
         # the US NHANES data by national shares of different ethnicities
 
         ethnicity_mapping = {
-            "Mexican American": "latino_age_cohorts",
-            "Black": "black_age_cohorts",
-            "White": "white_age_cohorts",
+            "Mexican American": "latino",
+            "Black": "black",
+            "White": "white",
         }
         estimate_weights: list[tuple[Prevalence, Population]] = []
         for row in csv.reader(inf):
@@ -149,82 +84,25 @@ def us_seroprevalence_2020() -> Prevalence:
             )
 
             if ethnicity in ethnicity_mapping:
-                cohort_size = 0
-                if (
-                    age_range == "18_19"
-                ):  # Matching 18-19 year old EBV+ rates with adult population
-                    population = Population(
-                        people=race_cohorts[ethnicity_mapping[ethnicity]][
-                            "adults"
-                        ],
-                        source=CENSUS_QUERY,
-                        country="United States",
-                        date="2020",
-                    )
-
+                # We don't use the 18-19 year old EBV+ rates, which would
+                # match the adult population.
+                if age_range == "18_19":
                     continue
 
-                population = Population(
-                    people=sum(
-                        race_cohorts[ethnicity_mapping[ethnicity]].values()
-                    ),
-                    source=CENSUS_QUERY,
-                    country="United States",
-                    date="2020",
+                estimate_weights.append(
+                    (
+                        prevalence,
+                        population(
+                            "United States",
+                            2020,
+                            cohort=ethnicity_mapping[ethnicity],
+                        ),
+                    )
                 )
 
-                estimate_weights.append((prevalence, population))
-
     return Prevalence.weightedAverageByPopulation(*estimate_weights)
 
 
-def load_denmark_populations_by_age() -> dict[tuple[int, int], Population]:
-    with open(prevalence_data_filename("DenmarkPopulationData.csv")) as file:
-        # Source for CSV: https://www.census.gov/data-tools/demo/idb/#/pop?COUNTRY_YEAR=2023&COUNTRY_YR_ANIM=2023&FIPS_SINGLE=DA&menu=popViz&FIPS=DA&POP_YEARS=2023&popPages=BYAGE
-        # We are applying the seroprevalence data from 1983 to current
-        # population data, given that there is no more recent seroprevalence
-        # data available.
-        denmark_age_groups: Counter[tuple[int, int]] = Counter()
-        # (min_age, max_age) -> people within that age range
-        reader = csv.reader(file)
-        next(reader)  # Skip the header
-
-        for row in reader:
-            # Skip the total population row
-            if row[4] == "TOTAL":
-                continue
-
-            # Extract the age from the first column & turn "100+" into 100
-            age = int(row[4].replace("+", ""))
-            if age == 0:
-                age_group = 0, 0
-            elif age <= 3:
-                age_group = 1, 3
-            elif age <= 14:
-                age_group = 4, 14
-            elif age <= 17:
-                age_group = 15, 17
-            elif age <= 29:
-                age_group = 18, 29
-            elif age <= 100:
-                age_group = 30, 100
-            else:
-                assert False
-            # Remove spaces from the numbers and add them to the respective
-            # age group
-            denmark_age_groups[age_group] += int(row[5].replace(" ", ""))
-
-        denmark_populations = {}
-        for (min_age, max_age), people in denmark_age_groups.items():
-            denmark_populations[min_age, max_age] = Population(
-                people=people,
-                date="2023",
-                country="Denmark",
-                source="https://www.census.gov/data-tools/demo/idb/#/pop?COUNTRY_YEAR=2023&COUNTRY_YR_ANIM=2023&FIPS_SINGLE=DA&menu=popViz&FIPS=DA&POP_YEARS=2023&popPages=BYAGE",
-            )
-    return denmark_populations
-
-
 def denmark_seroprevalence_2023() -> Prevalence:
     DENMARK_SEROPREVALENCE_SOURCE = "10.3109/inf.1983.15.issue-4.03"
 
@@ -245,12 +123,15 @@ def denmark_seroprevalence_2023() -> Prevalence:
             source=DENMARK_SEROPREVALENCE_SOURCE,
         )
 
-    denmark_populations = load_denmark_populations_by_age()
-
+    # We are applying the seroprevalence data from 1983 to current population
+    # data, given that there is no more recent seroprevalence data available.
     return Prevalence.weightedAverageByPopulation(
         *[
-            (denmark_seroprevalences[age], denmark_populations[age])
-            for age in denmark_populations.keys()
+            (
+                seroprevalence,
+                population("Denmark", 2023, ages=ages),
+            )
+            for ages, seroprevalence in denmark_seroprevalences.items()
         ]
     )
 
@@ -1,6 +1,10 @@
 import csv
 import dataclasses
 import datetime
+import functools
+from dataclasses import dataclass
+
+import numpy as np
 
 from pathogen_properties import *
 from populations import us_population
@@ -57,13 +61,36 @@ def parse_mmwr_week(year: int, week: int) -> datetime.date:
         return first_sunday_of_year + datetime.timedelta(weeks=week - 2)
 
 
-WeeklyData = dict[str, dict[datetime.date, tuple[int, int]]]
+@functools.cache
+def mmwr_calendar(first_year: int, last_year: int) -> np.ndarray:
+    """Ordinal of the start of MMWR week 1 for each year, inclusive."""
+    return np.array(
+        [
+            parse_mmwr_week(year, 1).toordinal()
+            for year in range(first_year, last_year + 1)
+        ],
+        dtype=np.int64,
+    )
 
 
-def load_weekly_data() -> WeeklyData:
-    # State -> Week -> (PositiveA, PositiveB)
-    output: WeeklyData = {}
+def parse_mmwr_weeks(years: np.ndarray, weeks: np.ndarray) -> np.ndarray:
+    """Vectorized parse_mmwr_week, returning ordinals."""
+    first_year = int(years.min())
+    week_ones = mmwr_calendar(first_year, int(years.max()))
+    return week_ones[years - first_year] + 7 * (weeks - 1)
+
+
+@dataclass
+class WeeklyData:
+    """Positive tests by state and week, one row per state-week."""
+
+    region: np.ndarray  # str
+    start: np.ndarray  # int64 ordinal of the Sunday starting the week
+    positive_a: np.ndarray  # int64
+    positive_b: np.ndarray  # int64
 
+
+def load_weekly_data() -> WeeklyData:
     # Downloaded 2023-05-08 from
     # https://gis.cdc.gov/grasp/fluview/fluportaldashboard.html with options:
     #   Select Data Source:
@@ -84,34 +111,26 @@ def load_weekly_data() -> WeeklyData:
     with open(
         prevalence_data_filename("CDC_WHO_NREVSS_Clinical_Labs.csv")
     ) as inf:
-        cols = None
-        for row in csv.reader(inf):
-            if row[0].startswith("*"):
-                continue  # initial comment
-
-            if not cols:
-                cols = row
-                continue
-
-            region = row[cols.index("REGION")]
-            year = int(row[cols.index("YEAR")])
-            mmwr_week = int(row[cols.index("WEEK")])
-            parsed_start = parse_mmwr_week(year, mmwr_week)
-            total_tests = row[cols.index("TOTAL SPECIMENS")]
-            positive_a = row[cols.index("TOTAL A")]
-            positive_b = row[cols.index("TOTAL B")]
-
-            if total_tests == positive_a == positive_b == "X":
-                continue
-
-            if region not in output:
-                output[region] = {}
-
-            output[region][parsed_start] = (
-                int(positive_a),
-                int(positive_b),
-            )
-    return output
+        reader = csv.reader(inf)
+        # Skip the initial comment.
+        cols = next(row for row in reader if not row[0].startswith("*"))
+        counts = [
+            cols.index(col)
+            for col in ["TOTAL SPECIMENS", "TOTAL A", "TOTAL B"]
+        ]
+        # States with no data for a week have X for every count.
+        rows = [row for row in reader if any(row[i] != "X" for i in counts)]
+
+    columns = dict(zip(cols, zip(*rows)))
+    return WeeklyData(
+        region=np.array(columns["REGION"]),
+        start=parse_mmwr_weeks(
+            np.array(columns["YEAR"], dtype=np.int64),
+            np.array(columns["WEEK"], dtype=np.int64),
+        ),
+        positive_a=np.array(columns["TOTAL A"], dtype=np.int64),
+        positive_b=np.array(columns["TOTAL B"], dtype=np.int64),
+    )
 
 
 infections_2019_2020 = IncidenceAbsolute(
@@ -142,53 +161,76 @@ infections_2021_2022 = IncidenceAbsolute(
 
 
 def compare_incidence_to_positive_tests(
-    official_incidence: IncidenceAbsolute, weekly_data: WeeklyData
-) -> Scalar:
-    annual_infections = 0
-    min_date = None
-    max_date = None
-    for state in weekly_data:
-        for parsed_start in weekly_data[state]:
-            parsed_end = parsed_start + datetime.timedelta(weeks=1)
-            assert official_incidence.parsed_start
-            assert official_incidence.parsed_end
-            if (
-                parsed_start >= official_incidence.parsed_start
-                and parsed_end <= official_incidence.parsed_end
-            ):
-                if not min_date or min_date > parsed_start:
-                    min_date = parsed_start
-
-                if not max_date or max_date < parsed_end:
-                    max_date = parsed_end
-
-                positive_a, positive_b = weekly_data[state][parsed_start]
-                annual_infections += positive_a + positive_b
-
-    assert min_date
-    assert max_date
-    clinical_labs_infections = IncidenceAbsolute(
-        annual_infections=annual_infections,
-        tag="us-%s-%s" % (min_date.year, max_date.year),
+    official_incidences: Sequence[IncidenceAbsolute], weekly_data: WeeklyData
+) -> list[Scalar]:
+    """For each season, how many infections there are per positive test.
+
+    Seasons can't overlap, and each counts the weeks entirely within it.
+    """
+    season_starts, season_ends = np.array(
+        [
+            [date.toordinal() for date in incidence.get_dates()]
+            for incidence in official_incidences
+        ]
+    ).T
+    by_start = np.argsort(season_starts)
+    assert (season_starts[by_start][1:] >= season_ends[by_start][:-1]).all()
+
+    # The season starting most recently before each week, if it covers the
+    # whole week.
+    week_starts = weekly_data.start
+    week_ends = week_starts + 7
+    latest = (
+        np.searchsorted(season_starts[by_start], week_starts, side="right") - 1
     )
-
-    return official_incidence / clinical_labs_infections
-
-
-def estimate_incidences() -> list[IncidenceRate]:
-    # State -> Week -> (PositiveA, PositiveB)
+    season = by_start[latest]
+    in_season = (latest >= 0) & (week_ends <= season_ends[season])
+    season = season[in_season]
+
+    num_seasons = len(official_incidences)
+    assert (np.bincount(season, minlength=num_seasons) > 0).all()
+    positive_tests = np.zeros(num_seasons, dtype=np.int64)
+    np.add.at(
+        positive_tests,
+        season,
+        (weekly_data.positive_a + weekly_data.positive_b)[in_season],
+    )
+    min_dates = np.full(num_seasons, np.iinfo(np.int64).max)
+    np.minimum.at(min_dates, season, week_starts[in_season])
+    max_dates = np.zeros(num_seasons, dtype=np.int64)
+    np.maximum.at(max_dates, season, week_ends[in_season])
+
+    return [
+        official_incidence
+        / IncidenceAbsolute(
+            annual_infections=annual_infections,
+            tag="us-%s-%s"
+            % (
+                datetime.date.fromordinal(min_date).year,
+                datetime.date.fromordinal(max_date).year,
+            ),
+        )
+        for official_incidence, annual_infections, min_date, max_date in zip(
+            official_incidences,
+            positive_tests.tolist(),
+            min_dates.tolist(),
+            max_dates.tolist(),
+        )
+    ]
+
+
+def estimate_incidences() -> PredictorTable[IncidenceRate]:
     weekly_data = load_weekly_data()
 
     # We can't just go from positive tests to incidence because many people
     # will get flu but never be tested, or their test won't make it back to the
     # CDC.  For each flu season we use the overall CDC incidence estimate and
     # our count of positive tests to get an estimate of underreporting.
-
-    underreporting_2019_2020 = compare_incidence_to_positive_tests(
-        infections_2019_2020, weekly_data
-    )
-    underreporting_2021_2022 = compare_incidence_to_positive_tests(
-        infections_2021_2022, weekly_data
+    (
+        underreporting_2019_2020,
+        underreporting_2021_2022,
+    ) = compare_incidence_to_positive_tests(
+        [infections_2019_2020, infections_2021_2022], weekly_data
     )
 
     # The CDC didn't estimate an annual infections for 2020-2021, but assume
@@ -197,79 +239,84 @@ def estimate_incidences() -> list[IncidenceRate]:
         underreporting_2019_2020, underreporting_2021_2022
     )
 
-    def get_underreporting(
-        start: datetime.date, end: datetime.date
-    ) -> Optional[Scalar]:
-        assert infections_2019_2020.parsed_start
-        assert infections_2019_2020.parsed_end
-        assert infections_2021_2022.parsed_start
-        assert infections_2021_2022.parsed_end
-
-        if (
-            start >= infections_2019_2020.parsed_start
-            and start <= infections_2019_2020.parsed_end
-        ):
-            return underreporting_2019_2020
-        elif (
-            start >= infections_2021_2022.parsed_start
-            and start <= infections_2021_2022.parsed_end
-        ):
-            return underreporting_2021_2022
-        elif (
-            start >= infections_2019_2020.parsed_end
-            and start <= infections_2021_2022.parsed_start
-        ):
-            return underreporting_2020_2021
-        else:
-            return None
-
-    incidences = []
-    for state in ["California", "Ohio"]:
-        for parsed_start in weekly_data[state]:
-            positive_a, positive_b = weekly_data[state][parsed_start]
-            parsed_end = parsed_start + datetime.timedelta(weeks=1)
-
-            for taxid, weekly_count in [
-                (FLU_A, positive_a),
-                (FLU_B, positive_b),
-            ]:
-                adjusted_weekly_count = float(weekly_count)
-                if parsed_start.year <= 2019:
-                    continue
-
-                underreporting = get_underreporting(parsed_start, parsed_end)
-                if not underreporting:
-                    continue
-
-                is_pseudocount = False
-                if weekly_count == 0:
-                    # See comment on QUANTITY_WHEN_NONE_OBSERVED.
-                    adjusted_weekly_count = QUANTITY_WHEN_NONE_OBSERVED
-                    is_pseudocount = True
-
-                incidence = IncidenceAbsolute(
-                    annual_infections=adjusted_weekly_count * 52,
-                    country="United States",
-                    state=state,
-                    date=parsed_start.isoformat(),
-                )
-
-                incidences.append(
-                    dataclasses.replace(
-                        (
-                            incidence.to_rate(
-                                us_population(
-                                    state=state, year=parsed_start.year
-                                )
-                            )
-                            * underreporting
-                        ),
-                        taxid=taxid,
-                        is_pseudocount=is_pseudocount,
-                    )
-                )
-
-    return incidences
+    assert infections_2019_2020.parsed_start
+    assert infections_2019_2020.parsed_end
+    assert infections_2021_2022.parsed_start
+    assert infections_2021_2022.parsed_end
+    start_2019 = infections_2019_2020.parsed_start.toordinal()
+    end_2020 = infections_2019_2020.parsed_end.toordinal()
+    start_2021 = infections_2021_2022.parsed_start.toordinal()
+    end_2022 = infections_2021_2022.parsed_end.toordinal()
+
+    rows = np.concatenate(
+        [
+            np.flatnonzero(weekly_data.region == state)
+            for state in ["California", "Ohio"]
+        ]
+    )
+    week_starts = weekly_data.start[rows]
+    underreportings = [
+        underreporting_2019_2020,
+        underreporting_2021_2022,
+        underreporting_2020_2021,
+    ]
+    underreporting_ids = np.select(
+        [
+            (week_starts >= start_2019) & (week_starts <= end_2020),
+            (week_starts >= start_2021) & (week_starts <= end_2022),
+            (week_starts >= end_2020) & (week_starts <= start_2021),
+        ],
+        [0, 1, 2],
+        default=-1,
+    )
+    keep = (underreporting_ids >= 0) & (
+        week_starts >= datetime.date(2020, 1, 1).toordinal()
+    )
+    rows = rows[keep]
+    week_starts = week_starts[keep]
+    underreporting_ids = underreporting_ids[keep]
+
+    # One population per state and year.
+    population_ids: dict[tuple[str, int], int] = {}
+    week_population_ids = np.array(
+        [
+            population_ids.setdefault((state, year), len(population_ids))
+            for state, year in zip(
+                weekly_data.region[rows].tolist(),
+                [
+                    datetime.date.fromordinal(week_start).year
+                    for week_start in week_starts.tolist()
+                ],
+            )
+        ]
+    )
+    populations = [
+        us_population(state=state, year=year) for state, year in population_ids
+    ]
+
+    # Each week has a row for Flu A and then one for Flu B.
+    weekly_counts = np.stack(
+        [weekly_data.positive_a[rows], weekly_data.positive_b[rows]], axis=1
+    ).ravel()
+    # See comment on QUANTITY_WHEN_NONE_OBSERVED.
+    is_pseudocount = weekly_counts == 0
+    adjusted_weekly_counts = np.where(
+        is_pseudocount, QUANTITY_WHEN_NONE_OBSERVED, weekly_counts
+    )
+    incidences = PredictorTable.build(
+        IncidenceAbsolute,
+        adjusted_weekly_counts * 52,
+        date=np.repeat(week_starts, 2),
+        country="United States",
+        state=np.repeat(weekly_data.region[rows], 2).tolist(),
+    )
+    return dataclasses.replace(
+        incidences.to_rate(
+            populations, np.repeat(week_population_ids, 2)
+        ).scale(underreportings, np.repeat(underreporting_ids, 2)),
+        taxid=np.tile([FLU_A, FLU_B], len(rows)).astype(np.int64),
+        is_pseudocount=is_pseudocount.astype(np.int8),
+    )
 
 
 def estimate_prevalences() -> list[Prevalence]:
@@ -1,6 +1,7 @@
 import csv
 import datetime
-from collections import Counter
+
+import numpy as np
 
 from pathogen_properties import *
 from populations import us_population
@@ -47,9 +48,20 @@ target_counties = set(
 )
 
 
-def estimate_incidences() -> list[IncidenceRate]:
-    estimates = []
+# In the csv file, cumulative case counts start at column 11 with counts for
+# 2020-01-22.
+FIRST_COUNT_COLUMN = 11
+FIRST_COUNT_DATE = datetime.date.fromisoformat("2020-01-22")
+
+
+def load_cumulative_cases() -> tuple[list[tuple[str, str]], np.ndarray]:
+    """Cumulative cases for each target county, by day.
 
+    Returns the (county, state) of each row, and an array of counts with one
+    row per county and one column per day starting with FIRST_COUNT_DATE.
+    """
+    locations = []
+    counts = []
     # From the COVID-19 Data Repository by the Center for Systems Science and
     # Engineering (CSSE) at Johns Hopkins University
     #
@@ -57,7 +69,9 @@ def estimate_incidences() -> list[IncidenceRate]:
     with open(
         prevalence_data_filename("time_series_covid19_confirmed_US.csv")
     ) as inf:
-        for row in csv.reader(inf):
+        reader = csv.reader(inf)
+        next(reader)  # Skip the header
+        for row in reader:
             truncated_county = row[5]
             state = row[6]
 
@@ -67,65 +81,74 @@ def estimate_incidences() -> list[IncidenceRate]:
             county = "%s County" % truncated_county
             county_state = "%s, %s" % (county, state)
 
+            # Only parse the counts for rows we want.
             if county_state not in target_counties:
                 continue
 
-            # In the tsv file, cumulative case counts start at column 11 with
-            # counts for 2020-01-22.
-            case_counts = [int(x) for x in row[11:]]
-            day = datetime.date.fromisoformat("2020-01-22")
-
-            # For computing a 7-day centered moving average.  We want a moving
-            # average because case reporting is not uniform over the week.
-            latest = [0] * 7
-
-            for prev_case_count, case_count in zip(
-                case_counts, case_counts[1:]
-            ):
-                # increment day at the beginning because zip means case_count
-                # never takes in the initial value.
-                day = day + datetime.timedelta(days=1)
-
-                # case counts are cumulative, but we want daily cases
-                delta = case_count - prev_case_count
-                latest.pop(0)
-                latest.append(delta)
-
-                # centered moving average
-                # https://www.jefftk.com/p/careful-with-trailing-averages
-                date = day - datetime.timedelta(days=3)
-                if date.year > 2022:
-                    continue
-
-                # Right now we use the same underreporting figure for both
-                # Spring/Fall 2020 and Winter 2021-2022.
-                #
-                # TODO: we can probably get a better undereporting figure for
-                # the omicron surge and this is likely too small.  The CDC 4x
-                # figure is not intended to cover this time period, this was
-                # after rapid tests were starting to be available, and omicron
-                # was relatively mild.
-
-                annual_infections = sum(latest) * 52
-
-                cases = IncidenceAbsolute(
-                    annual_infections=annual_infections,
-                    country="United States",
-                    state=state,
-                    county=county,
-                    date=date.isoformat(),
-                )
-
-                estimates.append(
-                    cases.to_rate(
-                        us_population(
-                            county=county, state=state, year=date.year
-                        )
-                    )
-                    * underreporting
-                )
-
-    return estimates
+            locations.append((county, state))
+            counts.append(np.array(row[FIRST_COUNT_COLUMN:], dtype=np.int64))
+    return locations, np.array(counts, dtype=np.int64)
+
+
+def estimate_incidences() -> PredictorTable[IncidenceRate]:
+    locations, cumulative_cases = load_cumulative_cases()
+
+    # Case counts are cumulative, but we want daily cases.  Day i of
+    # daily_cases is day i + 1 of cumulative_cases.
+    daily_cases = np.diff(cumulative_cases, axis=1)
+
+    # For computing a 7-day centered moving average.  We want a moving average
+    # because case reporting is not uniform over the week.  Treat days before
+    # the data starts as having no cases.
+    #
+    # https://www.jefftk.com/p/careful-with-trailing-averages
+    running_total = np.cumsum(daily_cases, axis=1)
+    weekly_cases = running_total.copy()
+    weekly_cases[:, 7:] -= running_total[:, :-7]
+    # Week i ends on day i + 1, and we date it by its center, three days
+    # earlier.
+    dates = FIRST_COUNT_DATE.toordinal() + np.arange(
+        1 - 3, daily_cases.shape[1] + 1 - 3, dtype=np.int64
+    )
+    in_range = dates <= datetime.date(2022, 12, 31).toordinal()
+    dates = dates[in_range]
+    weekly_cases = weekly_cases[:, in_range]
+
+    num_days = len(dates)
+    cases = PredictorTable.build(
+        IncidenceAbsolute,
+        (weekly_cases * 52).ravel(),
+        date=np.tile(dates, len(locations)),
+        country="United States",
+        state=[state for _, state in locations for _ in range(num_days)],
+        county=[county for county, _ in locations for _ in range(num_days)],
+    )
+
+    # Look up one population per county and year, and broadcast them over
+    # the days.
+    date_years = np.array(
+        [datetime.date.fromordinal(date).year for date in dates.tolist()]
+    )
+    years = np.unique(date_years)
+    populations = [
+        us_population(county=county, state=state, year=year)
+        for county, state in locations
+        for year in years.tolist()
+    ]
+    population_indices = (
+        np.arange(len(locations))[:, np.newaxis] * len(years)
+        + np.searchsorted(years, date_years)
+    ).ravel()
+
+    # Right now we use the same underreporting figure for both
+    # Spring/Fall 2020 and Winter 2021-2022.
+    #
+    # TODO: we can probably get a better undereporting figure for
+    # the omicron surge and this is likely too small.  The CDC 4x
+    # figure is not intended to cover this time period, this was
+    # after rapid tests were starting to be available, and omicron
+    # was relatively mild.
+    return cases.to_rate(populations, population_indices) * underreporting
 
 
 def estimate_prevalences() -> list[Prevalence]:
@@ -1,73 +1,250 @@
+import csv
+import itertools
+import re
+import threading
+from collections import Counter, defaultdict
+from dataclasses import dataclass
 from typing import Optional
 
-from pathogen_properties import Population, prevalence_data_filename
+from pathogen_properties import (
+    Population,
+    note_data_file,
+    prevalence_data_filename,
+)
 
-location_populations: list[tuple[str, dict[int, int]]] = []
+CENSUS_YEARS = [2020, 2021, 2022]
+CENSUS_COHORTS = ["black", "latino", "white"]
 
+CENSUS_COUNTIES_FILE = "Census-co-est2022-pop.tsv"
+DENMARK_FILE = "DenmarkPopulationData.csv"
+DATA_FILES = [CENSUS_COUNTIES_FILE, DENMARK_FILE] + [
+    f"{cohort}_age_cohorts.csv" for cohort in CENSUS_COHORTS
+]
 
-def load_location_populations():
-    if location_populations:
-        return
+CENSUS_COUNTIES_SOURCE = "https://www.census.gov/data/tables/time-series/demo/popest/2020s-counties-total.html"
+CENSUS_COHORTS_SOURCE = "https://data.census.gov/table?q=Annual+Estimates+of+the+Resident+Population+by+Single+Year"
+DENMARK_SOURCE = "https://www.census.gov/data-tools/demo/idb/#/pop?COUNTRY_YEAR=2023&COUNTRY_YR_ANIM=2023&FIPS_SINGLE=DA&menu=popViz&FIPS=DA&POP_YEARS=2023&popPages=BYAGE"
+
+# Populations are for a (country, state, county, year, cohort).
+PopulationGroup = tuple[str, Optional[str], Optional[str], int, Optional[str]]
+
+# Ages min through max, inclusive.  A max of None, or of the oldest age a
+# source lists, includes everyone older.
+AgeBand = tuple[int, Optional[int]]
+
+
+@dataclass
+class PopulationCounts:
+    """How many people are in a group, according to one source"""
+
+    source: str
+    date: str
+    people: int = 0
+    # For sources with single years of age, people_younger_than[age] is the
+    # number of people younger than age.
+    people_younger_than: Optional[list[int]] = None
+
+    def people_aged(self, ages: AgeBand) -> int:
+        if self.people_younger_than is None:
+            raise Exception("No ages for this population")
+        min_age, max_age = ages
+        oldest = len(self.people_younger_than) - 2
+        if max_age is None or max_age >= oldest:
+            max_age = oldest
+        if not 0 <= min_age <= max_age:
+            raise Exception("Bad ages: %s" % (ages,))
+        return (
+            self.people_younger_than[max_age + 1]
+            - self.people_younger_than[min_age]
+        )
+
+
+population_table: dict[PopulationGroup, PopulationCounts] = {}
+_population_table_lock = threading.Lock()
+_population_table_loaded = False
 
+# Populations we've already handed out, so callers that ask for the same one
+# once per day of a time series get the same object back.
+_populations: dict[tuple[PopulationGroup, Optional[AgeBand]], Population] = {}
+
+
+def _load_census_counties(
+    table: dict[PopulationGroup, PopulationCounts],
+) -> None:
     # Downloaded 2023-05-11 from
     # https://www2.census.gov/programs-surveys/popest/tables/2020-2022/counties/totals/co-est2022-pop.xlsx
-    with open(prevalence_data_filename("Census-co-est2022-pop.tsv")) as inf:
+    with open(prevalence_data_filename(CENSUS_COUNTIES_FILE)) as inf:
         for line in inf:
             bits = line.strip().split("\t")
             if len(bits) != 5:
                 continue
 
+            # Either "United States" or ".County, State".
             location = bits[0]
             counts = {
                 2020: int(bits[2].replace(",", "")),
                 2021: int(bits[3].replace(",", "")),
                 2022: int(bits[4].replace(",", "")),
             }
-            location_populations.append((location, counts))
+            for year, people in counts.items():
+                # All estimates are July 1st, specifically.
+                date = "%s-07-01" % year
+                if location == "United States":
+                    table["United States", None, None, year, None] = (
+                        PopulationCounts(CENSUS_COUNTIES_SOURCE, date, people)
+                    )
+                    continue
+                county, _, state = location[1:].rpartition(", ")
+                table["United States", state, county, year, None] = (
+                    PopulationCounts(CENSUS_COUNTIES_SOURCE, date, people)
+                )
+                state_counts = table.setdefault(
+                    ("United States", state, None, year, None),
+                    PopulationCounts(CENSUS_COUNTIES_SOURCE, date),
+                )
+                state_counts.people += people
 
 
-def us_population(
-    year: int, county: Optional[str] = None, state: Optional[str] = None
-) -> Population:
-    if year not in [2020, 2021, 2022]:
-        raise Exception("Unsupported year: %s" % year)
+def _load_census_cohorts(
+    by_age: defaultdict[PopulationGroup, Counter[int]],
+) -> None:
+    for cohort in CENSUS_COHORTS:
+        with open(
+            prevalence_data_filename(f"{cohort}_age_cohorts.csv")
+        ) as inf:
+            # Data is downloaded from this results page: "https://data.census.gov/table?q=Annual+Estimates+of+the+Resident+Population+by+Single+Year&g=010XX00US&tid=DECENNIALDHC2020.PCT12A".
+            # Specifically, we used PCT12I (White alone, not Hispanic or
+            # Latino), PCT12H (Hispanic or Latino), and PCT12B (Black or
+            # African American Alone), saved as
+            # [white, latino, black]_age_cohorts.csv.
+            reader = csv.reader(inf)
+
+            # Skip first two non-age lines
+            next(reader)
+            next(reader)
+
+            counts = by_age["United States", None, None, 2020, cohort]
+            for row in reader:
+                label = row[0].strip()
+                # Rows are broken down by sex, then by age, like "5 years" or
+                # "100 to 104 years".
+                if label == "Under 1 year":
+                    age = 0
+                elif match := re.search(r"\d+", label):
+                    age = int(match.group())
+                else:
+                    continue
+                counts[age] += int(row[1].replace(",", ""))
 
-    total_people = 0
-    # All estimates are July 1st, specifically.
-    pop_date = "%s-07-01" % year
-    source = "https://www.census.gov/data/tables/time-series/demo/popest/2020s-counties-total.html"
-    load_location_populations()
-    for location, counts in location_populations:
-        people = counts[year]
-        if not county and not state and location == "United States":
-            return Population(
-                people=people,
-                source=source,
-                date=pop_date,
-                country="United States",
+
+def _load_denmark(by_age: defaultdict[PopulationGroup, Counter[int]]) -> None:
+    # Source for CSV: https://www.census.gov/data-tools/demo/idb/#/pop?COUNTRY_YEAR=2023&COUNTRY_YR_ANIM=2023&FIPS_SINGLE=DA&menu=popViz&FIPS=DA&POP_YEARS=2023&popPages=BYAGE
+    with open(prevalence_data_filename(DENMARK_FILE)) as inf:
+        reader = csv.reader(inf)
+        next(reader)  # Skip the header
+
+        for row in reader:
+            # Skip the total population row
+            if row[4] == "TOTAL":
+                continue
+            # Turn "100+" into 100, and remove spaces from the numbers.
+            age = int(row[4].replace("+", ""))
+            by_age["Denmark", None, None, int(row[3]), None][age] += int(
+                row[5].replace(" ", "")
             )
 
-        if location == ".%s, %s" % (county, state):
-            return Population(
-                people=people,
-                source=source,
-                date=pop_date,
-                country="United States",
-                state=state,
-                county=county,
+
+def load_population_table() -> None:
+    global _population_table_loaded
+    if _population_table_loaded:
+        return
+    with _population_table_lock:
+        if _population_table_loaded:
+            return
+
+        table: dict[PopulationGroup, PopulationCounts] = {}
+        _load_census_counties(table)
+        for load, source in [
+            (_load_census_cohorts, CENSUS_COHORTS_SOURCE),
+            (_load_denmark, DENMARK_SOURCE),
+        ]:
+            by_age: defaultdict[PopulationGroup, Counter[int]] = defaultdict(
+                Counter
             )
+            load(by_age)
+            for group, counts in by_age.items():
+                people_younger_than = list(
+                    itertools.accumulate(
+                        (counts[age] for age in range(max(counts) + 1)),
+                        initial=0,
+                    )
+                )
+                _, _, _, year, _ = group
+                table[group] = PopulationCounts(
+                    source,
+                    str(year),
+                    people_younger_than[-1],
+                    people_younger_than,
+                )
+
+        population_table.update(table)
+        _population_table_loaded = True
 
-        if not county and location.endswith(", %s" % state):
-            total_people += people
 
-    if total_people == 0:
-        raise Exception("county=%r, state=%r not found" % (county, state))
+def population(
+    country: str,
+    year: int,
+    *,
+    state: Optional[str] = None,
+    county: Optional[str] = None,
+    ages: Optional[AgeBand] = None,
+    cohort: Optional[str] = None,
+) -> Population:
+    """The population of a place and year, or of part of it.
+
+    Narrow to an age band with ages, or to a demographic group the census
+    reports separately, like "white", with cohort.
+    """
+    load_population_table()
+    # The table is only loaded once, so tell anyone keeping track that this
+    # population depends on its files.
+    for filename in DATA_FILES:
+        note_data_file(filename)
+    group = (country, state or None, county or None, year, cohort)
+    if (group, ages) in _populations:
+        return _populations[group, ages]
 
-    # The only case where we total up is to get state populations.
-    return Population(
-        people=total_people,
-        source=source,
-        date=pop_date,
-        country="United States",
-        state=state,
+    if group not in population_table:
+        raise Exception("No population for %s" % (group,))
+    counts = population_table[group]
+    result = _populations[group, ages] = Population(
+        people=counts.people if ages is None else counts.people_aged(ages),
+        source=counts.source,
+        date=counts.date,
+        country=country,
+        state=state or None,
+        county=county or None,
+        tag=_tag(ages, cohort),
     )
+    return result
+
+
+def _tag(ages: Optional[AgeBand], cohort: Optional[str]) -> Optional[str]:
+    parts = [cohort] if cohort else []
+    if ages is not None:
+        min_age, max_age = ages
+        if max_age is None:
+            parts.append("%s+yo" % min_age)
+        elif min_age == max_age:
+            parts.append("%syo" % min_age)
+        else:
+            parts.append("%s-%syo" % (min_age, max_age))
+    return " ".join(parts) or None
+
+
+def us_population(
+    year: int, county: Optional[str] = None, state: Optional[str] = None
+) -> Population:
+    if year not in CENSUS_YEARS:
+        raise Exception("Unsupported year: %s" % year)
+    return population("United States", year, state=state, county=county)
@@ -1,3 +1,4 @@
+from collections.abc import Sequence
 from dataclasses import dataclass, field
 from datetime import date
 from pathlib import Path
@@ -12,8 +13,15 @@ import seaborn as sns  # type: ignore
 import stan  # type: ignore
 from scipy.stats import gamma, norm  # type: ignore
 
-from mgs import BioProject, Enrichment, MGSData, Sample, SampleAttributes
-from pathogen_properties import Predictor, TaxID, Variable
+from mgs import (
+    BioProject,
+    Enrichment,
+    MGSData,
+    Sample,
+    SampleAttributes,
+    SampleTable,
+)
+from pathogen_properties import Predictor, PredictorTable, TaxID, Variable
 
 county_neighbors = {
     "Los Angeles County": [
@@ -83,13 +91,16 @@ V = TypeVar("V", bound=Variable)
 
 def lookup_variables(
     attrs: SampleAttributes,
-    vars: list[V],
+    vars: Sequence[V],
 ) -> list[V]:
     # Rank all matches by how close they are, then return all the ones tied for
     # best if there are any acceptable ones.
     #
     # We prefer matches that are temporally and geographically close.
 
+    if isinstance(vars, PredictorTable):
+        return lookup_table(attrs, vars)
+
     qualities = [
         (quality, var)
         for var in vars
@@ -102,6 +113,52 @@ def lookup_variables(
     return [var for (quality, var) in qualities if quality == best_quality]
 
 
+def lookup_table(
+    attrs: SampleAttributes,
+    table: PredictorTable[V],
+) -> list[V]:
+    """lookup_variables, computing match_quality for all rows at once."""
+    assert isinstance(attrs.date, date)
+    target = attrs.date.toordinal()
+
+    matches = table.country == table.location_code(attrs.country)
+
+    has_state = table.state != 0
+    matches &= ~has_state | (table.state == table.location_code(attrs.state))
+    # Prefer the specific state.
+    quality = 20 * has_state
+
+    has_county = table.county != 0
+    exact_county = table.county == table.location_code(attrs.county)
+    close_counties = [
+        code
+        for code, county in enumerate(table.locations)
+        if county is not None and county_is_close(county, attrs.county)
+    ]
+    matches &= (
+        ~has_county | exact_county | np.isin(table.county, close_counties)
+    )
+    # Prefer an exact match
+    quality += 10 * (has_county & exact_county)
+
+    days_off = np.where(
+        (table.start <= target) & (target <= table.end),
+        0,
+        np.minimum(abs(table.start - target), abs(table.end - target)),
+    )
+    max_days_off = 7 * 2  # don't allow date matches more than two weeks out
+    matches &= days_off <= max_days_off
+    quality -= days_off
+
+    if not matches.any():
+        return []
+    best_quality = quality[matches].max()
+    return [
+        table[i]
+        for i in np.flatnonzero(matches & (quality == best_quality)).tolist()
+    ]
+
+
 P = TypeVar("P", bound=Predictor)
 
 
@@ -370,7 +427,7 @@ class Model(Generic[P]):
         plt.close("all")
 
 
-def choose_predictor(predictors: list[Predictor]) -> Predictor | None:
+def choose_predictor(predictors: Sequence[Predictor]) -> Predictor | None:
     if len(predictors) == 0:
         return None
     elif len(predictors) == 1:
@@ -382,26 +439,30 @@ def choose_predictor(predictors: list[Predictor]) -> Predictor | None:
 def build_model(
     mgs_data: MGSData,
     bioprojects: list[BioProject],
-    predictors: list[Predictor],
+    predictors: Sequence[Predictor],
     taxids: frozenset[TaxID],
     random_seed: int,
     enrichment: Optional[Enrichment],
 ) -> Model | None:
-    sample_attributes = {}  # sample -> attributes
-    study_viral_reads = {}  # sample -> viral_reads
-    for bioproject in bioprojects:
-        sample_attributes.update(
-            mgs_data.sample_attributes(bioproject, enrichment=enrichment)
-        )
-        study_viral_reads.update(mgs_data.viral_reads(bioproject, taxids))
+    samples = SampleTable.concat(
+        mgs_data.sample_table(bioproject, enrichment=enrichment)
+        for bioproject in bioprojects
+    )
+    # Line the viral read totals up with the samples by id, and only go back
+    # to accessions for the data points.
+    viral_reads = mgs_data.clade_totals(taxids)[
+        mgs_data.sample_ids.lookup(samples.samples)
+    ]
     data = [
         DataPoint(
             sample=sample,
             attrs=attrs,
-            viral_reads=study_viral_reads[sample],
+            viral_reads=sample_viral_reads,
             predictor=choose_predictor(lookup_variables(attrs, predictors)),
         )
-        for sample, attrs in sample_attributes.items()
+        for (sample, attrs), sample_viral_reads in zip(
+            samples.items(), viral_reads.tolist()
+        )
     ]
     # No predictors found
     if all(point.predictor is None for point in data):
@@ -58,10 +58,11 @@ def start(pathogen_names):
             )
             to_print.append(((location, date), line))
 
-        for estimate in pathogen.estimate_prevalences():
+        estimates = pathogens.estimates(pathogen_name)
+        for estimate in estimates["prevalence"]:
             save(estimate, "%.2f per 100k" % estimate.infections_per_100k)
 
-        for estimate in pathogen.estimate_incidences():
+        for estimate in estimates["incidence"]:
             save(
                 estimate,
                 "%.2f per 100k/y" % estimate.annual_infections_per_100k,
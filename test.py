@@ -1,21 +1,140 @@
 #!/usr/bin/env python3
 
+import dataclasses
 import datetime
+import functools
+import http.server
+import json
+import os
+import pickle
+import tarfile
+import tempfile
+import threading
+import tracemalloc
 import unittest
+import urllib.error
 from collections import Counter
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
 
 import mgs
 import pathogens
 import populations
 import stats
 from pathogen_properties import *
-from tree import Tree
+from tree import FlatTree, Tree
 
 
 class TestPathogens(unittest.TestCase):
     def test_hsv1_imported(self):
         self.assertIn("hsv_1", pathogens.pathogens)
 
+    def test_lazy_import(self):
+        registry = pathogens.PathogenModules(
+            os.path.dirname(pathogens.__file__)
+        )
+        self.assertEqual(list(registry), list(pathogens.pathogens))
+        self.assertEqual(registry.modules, {})
+        self.assertIs(registry["hiv"], pathogens.pathogens["hiv"])
+        self.assertEqual(list(registry.modules), ["hiv"])
+        self.assertNotIn("__init__", registry)
+        with self.assertRaises(KeyError):
+            registry["not_a_pathogen"]
+
+    def test_estimates_cache(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = Path(tmpdir)
+            with mock.patch.object(
+                pathogens,
+                "compute_estimates",
+                wraps=pathogens.compute_estimates,
+            ) as compute:
+                computed = pathogens.estimates("sars_cov_2", cache_dir)
+                self.assertEqual(compute.call_count, 1)
+                (cache_path,) = cache_dir.iterdir()
+
+                cached = pathogens.estimates("sars_cov_2", cache_dir)
+                self.assertEqual(compute.call_count, 1)
+                self.assertEqual(
+                    list(cached["incidence"]), list(computed["incidence"])
+                )
+                self.assertEqual(
+                    list(cached["incidence"]),
+                    list(
+                        pathogens.pathogens["sars_cov_2"].estimate_incidences()
+                    ),
+                )
+
+                # Data files that look different but aren't are fine.
+                entry = pickle.loads(cache_path.read_bytes())
+                self.assertIn(
+                    "time_series_covid19_confirmed_US.csv", entry.data_files
+                )
+                self.assertIn("Census-co-est2022-pop.tsv", entry.data_files)
+                for filename, (size, _, digest) in entry.data_files.items():
+                    entry.data_files[filename] = size, 0, digest
+                cache_path.write_bytes(pickle.dumps(entry))
+                pathogens.estimates("sars_cov_2", cache_dir)
+                self.assertEqual(compute.call_count, 1)
+
+                # Changed data files mean recomputing.
+                size, _, _ = entry.data_files[
+                    "time_series_covid19_confirmed_US.csv"
+                ]
+                entry.data_files["time_series_covid19_confirmed_US.csv"] = (
+                    size,
+                    0,
+                    "changed",
+                )
+                cache_path.write_bytes(pickle.dumps(entry))
+                pathogens.estimates("sars_cov_2", cache_dir)
+                self.assertEqual(compute.call_count, 2)
+
+                cache_path.write_bytes(b"truncated")
+                pathogens.estimates("sars_cov_2", cache_dir)
+                self.assertEqual(compute.call_count, 3)
+                pathogens.estimates("sars_cov_2", cache_dir)
+                self.assertEqual(compute.call_count, 3)
+
+                # Entries for older code are replaced.
+                stale = cache_dir / "sars_cov_2-old.pickle"
+                stale.write_bytes(b"")
+                cache_path.unlink()
+                pathogens.estimates("sars_cov_2", cache_dir)
+                self.assertEqual(list(cache_dir.iterdir()), [cache_path])
+
+    def test_all_estimates(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache_dir = Path(tmpdir)
+            # The cached pathogen is read in this process and the rest are
+            # computed in the pool.
+            pathogens.estimates("hiv", cache_dir)
+            results = pathogens.all_estimates(processes=2, cache_dir=cache_dir)
+            self.assertEqual(list(results), list(pathogens.pathogens))
+            for pathogen_name, pathogen_estimates in results.items():
+                expected = pathogens.compute_estimates(pathogen_name)
+                for predictor_type, predictors in expected.estimates.items():
+                    with self.subTest(
+                        pathogen=pathogen_name, predictor=predictor_type
+                    ):
+                        self.assertEqual(
+                            list(pathogen_estimates[predictor_type]),
+                            list(predictors),
+                        )
+            # The workers cached what they computed.
+            self.assertEqual(
+                len(list(cache_dir.iterdir())), len(pathogens.pathogens)
+            )
+
+    def test_tracked_taxids(self):
+        tracked = pathogens.tracked_taxids()
+        for pathogen_name, pathogen in pathogens.pathogens.items():
+            with self.subTest(pathogen=pathogen_name):
+                for taxid in pathogen.pathogen_chars.taxids:
+                    self.assertIn(taxid, tracked)
+
     def test_summarize_location(self):
         (
             us_2019,
@@ -118,6 +237,46 @@ class TestPathogens(unittest.TestCase):
                             seen.add(key)
 
 
+class TestSarsCov2(unittest.TestCase):
+    def test_moving_average(self):
+        sars_cov_2 = pathogens.pathogens["sars_cov_2"]
+        locations, cumulative_cases = sars_cov_2.load_cumulative_cases()
+        self.assertEqual(len(locations), len(sars_cov_2.target_counties))
+        estimates = sars_cov_2.estimate_incidences()
+        days_per_county = len(estimates) // len(locations)
+
+        for row in [0, len(locations) - 1]:
+            county, state = locations[row]
+            counts = cumulative_cases[row].tolist()
+            for day in [0, 3, 6, 7, 100, days_per_county - 1]:
+                with self.subTest(county=county, day=day):
+                    estimate = estimates[row * days_per_county + day]
+                    self.assertEqual(estimate.county, county)
+                    self.assertEqual(estimate.state, state)
+                    # Day 0 is the first daily count, covering the day after
+                    # the first cumulative count, centered 3 days earlier.
+                    self.assertEqual(
+                        estimate.get_date(),
+                        sars_cov_2.FIRST_COUNT_DATE
+                        + datetime.timedelta(days=day + 1 - 3),
+                    )
+                    weekly_cases = counts[day + 1] - counts[max(0, day - 6)]
+                    population = populations.us_population(
+                        county=county,
+                        state=state,
+                        year=estimate.get_date().year,
+                    )
+                    self.assertEqual(
+                        estimate.annual_infections_per_100k,
+                        weekly_cases
+                        * 52
+                        * 100000
+                        / population.people
+                        * sars_cov_2.underreporting.scalar,
+                    )
+        self.assertEqual(estimates[-1].get_date(), datetime.date(2022, 12, 31))
+
+
 class TestMMWRWeek(unittest.TestCase):
     def test_mmwr_week(self):
         self.assertEqual(
@@ -151,6 +310,19 @@ class TestMMWRWeek(unittest.TestCase):
             datetime.date(2015, 1, 4),
         )
 
+    def test_mmwr_weeks(self):
+        influenza = pathogens.pathogens["influenza"]
+        years, weeks = np.meshgrid(np.arange(2014, 2024), [1, 2, 30, 52])
+        np.testing.assert_array_equal(
+            influenza.parse_mmwr_weeks(years.ravel(), weeks.ravel()),
+            [
+                influenza.parse_mmwr_week(year, week).toordinal()
+                for year, week in zip(
+                    years.ravel().tolist(), weeks.ravel().tolist()
+                )
+            ],
+        )
+
 
 class TestVaribles(unittest.TestCase):
     def test_date_parsing(self):
@@ -190,6 +362,13 @@ class TestVaribles(unittest.TestCase):
             (datetime.date(2020, 1, 7), datetime.date(2020, 2, 6)),
         )
 
+        day = datetime.date(2020, 2, 1)
+        for spec in [day, day.toordinal()]:
+            v = Variable(date=spec)
+            self.assertEqual(v.get_dates(), (day, day))
+            v = Variable(start_date=spec, end_date="2020-02")
+            self.assertEqual(v.get_dates(), (day, datetime.date(2020, 2, 29)))
+
         v1 = Variable(date="2019")
         v2 = Variable(date="2020", date_source=v1)
         self.assertEqual(
@@ -221,6 +400,10 @@ class TestVaribles(unittest.TestCase):
         with self.assertRaises(Exception):
             Variable(date="2020/01/01")
 
+        for bad in ["20201", "2020-1-01", "２０２０", "2020-02-30", "2020-13"]:
+            with self.subTest(date=bad), self.assertRaises(Exception):
+                Variable(date=bad)
+
         v = Variable(date="2020")
         with self.assertRaises(AssertionError):
             v.get_date()  # asserts start==end
@@ -254,6 +437,79 @@ class TestVaribles(unittest.TestCase):
             ("United States", "Ohio", "Franklin County"), v3.get_location()
         )
 
+    def test_inputs(self):
+        population = Population(
+            people=100, country="United States", date="2020"
+        )
+        scalar = Scalar(scalar=0.5)
+        half = population * scalar
+        self.assertEqual(half.direct_inputs, (population, scalar))
+        self.assertEqual(half.all_inputs, {population, scalar})
+
+        quarter = half * scalar
+        self.assertEqual(quarter.all_inputs, {half, population, scalar})
+        # replace keeps the original inputs and adds the new sources.
+        source = Variable(date="2021")
+        replaced = dataclasses.replace(quarter, date_source=source)
+        self.assertEqual(
+            replaced.all_inputs, {half, population, scalar, source}
+        )
+
+    def test_equality(self):
+        a = Scalar(scalar=0.5, date="2020", country="United States")
+        b = Scalar(scalar=0.5, date="2020", country="United States")
+        c = Scalar(scalar=0.5, date="2021", country="United States")
+        self.assertEqual(a, b)
+        self.assertEqual(hash(a), hash(b))
+        self.assertNotEqual(a, c)
+        self.assertEqual(len({a, b, c}), 2)
+        # Same fields, different class.
+        self.assertNotEqual(a, Number(number=0.5, date="2020"))
+        self.assertNotEqual(
+            Number(number=0.5, date="2020"), Scalar(scalar=0.5, date="2020")
+        )
+        # Derived variables compare their inputs too.
+        self.assertEqual(Scalar.average(a, b), Scalar.average(b, a))
+        self.assertNotEqual(Scalar.average(a, b), Scalar.average(a, c))
+        # Order of inputs doesn't matter.
+        d = Scalar(scalar=0.5, date="2021", country="United States")
+        self.assertEqual(Scalar.average(a, c), Scalar.average(d, b))
+        self.assertEqual(
+            hash(Scalar.average(a, c)), hash(Scalar.average(d, b))
+        )
+
+    def test_metadata(self):
+        a = Scalar(scalar=1, source="a.csv", confidence_interval=(0, 2))
+        b = Scalar(scalar=2, source="a.csv", confidence_interval=(0, 2))
+        self.assertIs(a.metadata, b.metadata)
+        assert a.metadata is not None
+        self.assertEqual(a.metadata.source, "a.csv")
+        self.assertIsNone(Scalar(scalar=1).metadata)
+        self.assertNotEqual(a, Scalar(scalar=1, source="b.csv"))
+        replaced = dataclasses.replace(a, methods="guess")
+        assert replaced.metadata is not None
+        self.assertEqual(replaced.metadata.source, "a.csv")
+        self.assertEqual(replaced.metadata.methods, "guess")
+        self.assertFalse(hasattr(a, "__dict__"))
+
+    def test_pickle(self):
+        population = Population(
+            people=100, country="United States", date="2020"
+        )
+        half = population * Scalar(scalar=0.5, source="a.csv")
+        copy = pickle.loads(pickle.dumps(half))
+        self.assertEqual(copy, half)
+        self.assertEqual(hash(copy), hash(half))
+        self.assertEqual(copy.all_inputs, half.all_inputs)
+        self.assertIsInstance(copy.direct_inputs, tuple)
+
+    def test_long_derivation(self):
+        scalar = Scalar(scalar=1)
+        population = Population(people=1, country="United States", date="2020")
+        for _ in range(5000):
+            population = population * scalar
+        self.assertEqual(len(population.all_inputs), 5001)
+
 
 class TestMGS(unittest.TestCase):
     repo = mgs.GitHubRepo(**mgs.MGS_REPO_DEFAULTS)
@@ -304,6 +560,505 @@ class TestMGS(unittest.TestCase):
         self.assertEqual(mgs.count_reads(taxtree, sample_counts), expected)
 
 
+class TestInterner(unittest.TestCase):
+    def test_intern(self):
+        interner = mgs.Interner(["b", "a", "b"])
+        self.assertEqual(interner.values, ["b", "a"])
+        self.assertEqual(interner.intern("c"), 2)
+        self.assertEqual(interner.intern("a"), 1)
+        self.assertEqual(list(interner.intern_all(["c", "d"])), [2, 3])
+        self.assertEqual(list(interner.lookup(["d", "e", "b"])), [3, -1, 0])
+        self.assertEqual(interner[3], "d")
+        self.assertEqual(len(interner), 4)
+        self.assertIn("a", interner)
+        self.assertNotIn("e", interner)
+
+
+class TestSampleCountMatrix(unittest.TestCase):
+    sample_counts = {
+        mgs.TaxID(5): {mgs.Sample("b"): 3, mgs.Sample("a"): 2},
+        mgs.TaxID(0): {mgs.Sample("a"): 4},
+        mgs.TaxID(7): {},
+    }
+    matrix = mgs.SampleCountMatrix.from_dict(sample_counts)
+
+    def test_mapping(self):
+        self.assertEqual(self.matrix, self.sample_counts)
+        self.assertEqual(len(self.matrix), 3)
+        self.assertIn(mgs.TaxID(7), self.matrix)
+        self.assertNotIn(mgs.TaxID(1), self.matrix)
+        self.assertEqual(self.matrix[mgs.TaxID(5)][mgs.Sample("b")], 3)
+        self.assertIsInstance(self.matrix[mgs.TaxID(5)][mgs.Sample("b")], int)
+        self.assertEqual(dict(self.matrix[mgs.TaxID(7)]), {})
+        with self.assertRaises(KeyError):
+            self.matrix[mgs.TaxID(0)][mgs.Sample("b")]
+        with self.assertRaises(KeyError):
+            self.matrix[mgs.TaxID(1)]
+
+    def test_rows_sorted(self):
+        columns, counts = self.matrix.row(mgs.TaxID(5))
+        self.assertEqual(list(columns), sorted(columns))
+        self.assertEqual(
+            {self.matrix.samples[c]: n for c, n in zip(columns, counts)},
+            {mgs.Sample("a"): 2, mgs.Sample("b"): 3},
+        )
+
+    def test_count_reads(self):
+        taxtree = Tree(mgs.TaxID(0), [Tree(mgs.TaxID(i)) for i in range(5, 8)])
+        self.assertEqual(
+            mgs.count_reads(taxtree, self.matrix),
+            Counter({mgs.Sample("a"): 6, mgs.Sample("b"): 3}),
+        )
+
+
+class TestCladeCounts(unittest.TestCase):
+    a, b, c = mgs.Sample("a"), mgs.Sample("b"), mgs.Sample("c")
+    taxtree = Tree(
+        mgs.TaxID(0),
+        [
+            Tree(mgs.TaxID(1), [Tree(mgs.TaxID(3)), Tree(mgs.TaxID(4))]),
+            Tree(mgs.TaxID(2)),
+        ],
+    )
+    sample_counts = {
+        mgs.TaxID(0): {a: 1},
+        mgs.TaxID(1): {b: 2},
+        mgs.TaxID(3): {a: 3, b: 4},
+        mgs.TaxID(4): {c: 5},
+        mgs.TaxID(9): {c: 100},  # Not in the tree
+    }
+
+    def test_build_clade_counts(self):
+        clade_counts = mgs.build_clade_counts(self.taxtree, self.sample_counts)
+        self.assertEqual(set(clade_counts), {0, 1, 2, 3, 4})
+        for node in self.taxtree:
+            with self.subTest(taxid=node.data):
+                self.assertEqual(
+                    Counter(clade_counts[node.data]),
+                    mgs.count_reads(node, self.sample_counts),
+                )
+        self.assertEqual(
+            dict(clade_counts[mgs.TaxID(0)]), {self.a: 4, self.b: 6, self.c: 5}
+        )
+        self.assertEqual(dict(clade_counts[mgs.TaxID(2)]), {})
+
+    def test_pruned_count_tree(self):
+        flat = FlatTree.from_tree(self.taxtree)
+        pruned = mgs.make_pruned_count_tree(flat, self.sample_counts, [self.c])
+        self.assertEqual(
+            pruned,
+            Tree(
+                (mgs.TaxID(0), Counter()),
+                [
+                    Tree(
+                        (mgs.TaxID(1), Counter()),
+                        [Tree((mgs.TaxID(4), Counter({self.c: 5})))],
+                    )
+                ],
+            ),
+        )
+        # With every sample, it's the same as the full count tree except for
+        # the taxids without any reads.
+        pruned = mgs.make_pruned_count_tree(
+            flat, self.sample_counts, [self.a, self.b, self.c]
+        )
+        assert pruned is not None
+        self.assertEqual(
+            [node.data for node in pruned],
+            [
+                node.data
+                for node in mgs.make_count_tree(
+                    self.taxtree, self.sample_counts
+                )
+                if node.data[0] != 2
+            ],
+        )
+        self.assertIsNone(
+            mgs.make_pruned_count_tree(
+                flat, self.sample_counts, [mgs.Sample("d")]
+            )
+        )
+
+    def test_viral_reads(self):
+        bioproject = mgs.BioProject("bp")
+        d = mgs.Sample("d")  # No reads at all
+        mgs_data = mgs.MGSData(
+            bioprojects={bioproject: [self.a, self.b, self.c, d]},
+            sample_attrs=mgs.SampleTable.from_dict({}),
+            read_counts=mgs.SampleCountMatrix.from_dict(self.sample_counts),
+            tax_tree=self.taxtree,
+        )
+        self.assertEqual(
+            mgs_data.viral_reads(bioproject, [mgs.TaxID(3), mgs.TaxID(4)]),
+            {self.a: 3, self.b: 4, self.c: 5, d: 0},
+        )
+        self.assertEqual(
+            mgs_data.viral_reads(bioproject, [mgs.TaxID(2), mgs.TaxID(9)]),
+            {self.a: 0, self.b: 0, self.c: 0, d: 0},
+        )
+        self.assertEqual(
+            mgs_data.tracked_clades(
+                [mgs.TaxID(3), mgs.TaxID(4), mgs.TaxID(2), mgs.TaxID(9)],
+                {mgs.TaxID(1), mgs.TaxID(4)},
+            ).tolist(),
+            [1, 4, -1, -1],
+        )
+        # Sample ids agree with the clade count columns.
+        totals = mgs_data.clade_totals([mgs.TaxID(1)])
+        self.assertEqual(
+            totals[mgs_data.sample_ids.lookup([self.a, self.b, d])].tolist(),
+            [3, 6, 0],
+        )
+
+
+class TestSampleTable(unittest.TestCase):
+    raw = {
+        "s1": {
+            "country": "United States",
+            "state": "California",
+            "county": "San Diego County",
+            "location": "Los Angeles",
+            "fine_location": "PL",
+            "date": "2020-08-27",
+            "reads": 100,
+            "enrichment": "viral",
+        },
+        "s2": {
+            "country": "United States",
+            "location": "Ohio",
+            "date": "2021-11-01",
+            "reads": 200,
+            "enrichment": "panel",
+            "method": "IJ",
+        },
+        "s3": {
+            "country": "Denmark",
+            "location": "Copenhagen",
+            "date": "2015-06-01",
+            "reads": 300,
+        },
+    }
+
+    def test_matches_sample_attributes(self):
+        table = mgs.SampleTable.from_dict(self.raw)
+        expected = {
+            mgs.Sample(s): mgs.SampleAttributes(**attrs)
+            for s, attrs in self.raw.items()
+        }
+        self.assertEqual(dict(table.items()), expected)
+        for sample, attrs in expected.items():
+            with self.subTest(sample=sample):
+                self.assertEqual(table[sample], attrs)
+        self.assertNotIn(mgs.Sample("s4"), table)
+        with self.assertRaises(KeyError):
+            table[mgs.Sample("s4")]
+
+    def test_non_date(self):
+        raw = {"s1": dict(self.raw["s1"], date="2020-2021")}
+        table = mgs.SampleTable.from_dict(raw)
+        self.assertEqual(table[mgs.Sample("s1")].date, "2020-2021")
+
+    def test_select(self):
+        table = mgs.SampleTable.from_dict(self.raw)
+        self.assertEqual(
+            table.select([mgs.Sample("s3"), mgs.Sample("s1")]).samples,
+            ["s3", "s1"],
+        )
+        self.assertEqual(
+            table.select(enrichment=mgs.Enrichment.VIRAL).samples, ["s1"]
+        )
+        self.assertEqual(
+            table.select(
+                [mgs.Sample("s2"), mgs.Sample("s3")],
+                enrichment=mgs.Enrichment.VIRAL,
+            ).samples,
+            [],
+        )
+
+    def test_validation(self):
+        for name, attrs in [
+            ("missing country", {"country": None}),
+            ("bad reads", {"reads": "many"}),
+            ("fractional reads", {"reads": 1.5}),
+            ("bad enrichment", {"enrichment": "bogus"}),
+        ]:
+            with self.subTest(name):
+                with self.assertRaises(ValueError):
+                    mgs.SampleTable.from_dict(
+                        {"s1": dict(self.raw["s1"], **attrs)}
+                    )
+
+
+class TestMGSSnapshot(unittest.TestCase):
+    mgs_data = mgs.MGSData(
+        bioprojects={
+            mgs.BioProject("bp1"): [mgs.Sample("s1"), mgs.Sample("s2")],
+            mgs.BioProject("bp2"): [mgs.Sample("s3")],
+        },
+        sample_attrs=mgs.SampleTable.from_dict(TestSampleTable.raw),
+        read_counts=mgs.SampleCountMatrix.from_dict(
+            {
+                mgs.TaxID(0): {mgs.Sample("s1"): 1},
+                mgs.TaxID(3): {mgs.Sample("s3"): 3, mgs.Sample("s2"): 4},
+            }
+        ),
+        tax_tree=Tree(mgs.TaxID(0), [Tree(mgs.TaxID(i)) for i in range(1, 4)]),
+    )
+
+    def test_round_trip(self):
+        for mmap in [True, False]:
+            with self.subTest(mmap=mmap), tempfile.TemporaryDirectory() as tmp:
+                self.mgs_data.save(tmp)
+                loaded = mgs.MGSData.load(tmp, mmap=mmap)
+                self.assertEqual(loaded.bioprojects, self.mgs_data.bioprojects)
+                self.assertEqual(
+                    dict(loaded.sample_attrs.items()),
+                    dict(self.mgs_data.sample_attrs.items()),
+                )
+                self.assertEqual(loaded.read_counts, self.mgs_data.read_counts)
+                self.assertEqual(loaded.tax_tree, self.mgs_data.tax_tree)
+                self.assertEqual(
+                    loaded.viral_reads(mgs.BioProject("bp1"), [mgs.TaxID(0)]),
+                    {mgs.Sample("s1"): 1, mgs.Sample("s2"): 4},
+                )
+
+
+class TestDataSources(unittest.TestCase):
+    dashboard = {
+        mgs.BIOPROJECTS_PATH: {"bp1": ["s1", "s2"], "bp2": ["s3"]},
+        mgs.SAMPLES_PATH: TestSampleTable.raw,
+        mgs.SAMPLE_COUNTS_PATH: {"0": {"s1": 1}, "3": {"s3": 3, "s2": 4}},
+        mgs.TAX_TREE_PATH: [0, [1], [2], [3]],
+    }
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmpdir.name) / "mgs-pipeline"
+        for path, contents in self.dashboard.items():
+            (self.root / path).parent.mkdir(parents=True, exist_ok=True)
+            (self.root / path).write_text(json.dumps(contents))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def check_source(self, source: mgs.DataSource):
+        mgs_data = mgs.MGSData.from_source(source)
+        self.assertEqual(mgs_data, TestMGSSnapshot.mgs_data)
+        with self.assertRaises(Exception):
+            source.get_file("dashboard/missing.json")
+
+    def test_local_directory(self):
+        self.check_source(mgs.LocalDirectory(self.root))
+
+    def test_lazy(self):
+        source = mgs.LocalDirectory(self.root)
+        mgs_data = mgs.MGSData.from_source(source, bioprojects=["bp2"])
+        self.assertEqual(set(mgs_data.sample_attrs), {"s3"})
+        self.assertEqual(mgs_data.viral_reads("bp2", [3]), {"s3": 3})
+        # Touching another bioproject loads its samples too, decoding just
+        # the sample attributes again.
+        with mock.patch.object(mgs.json, "loads", wraps=json.loads) as loads:
+            self.assertEqual(
+                mgs_data.viral_reads("bp1", [0]), {"s1": 1, "s2": 4}
+            )
+        self.assertEqual(loads.call_count, 1)
+        self.assertEqual(mgs_data.total_reads("bp1"), {"s1": 100, "s2": 200})
+        self.assertEqual(mgs_data, TestMGSSnapshot.mgs_data)
+
+    def test_lazy_memory(self):
+        samples = ["s%d" % i for i in range(2000)]
+        root = Path(self.tmpdir.name) / "large"
+        for path, contents in {
+            mgs.BIOPROJECTS_PATH: {
+                "bp%d" % i: samples[i::20] for i in range(20)
+            },
+            mgs.SAMPLES_PATH: {
+                sample: dict(TestSampleTable.raw["s1"], reads=i)
+                for i, sample in enumerate(samples)
+            },
+            mgs.SAMPLE_COUNTS_PATH: {
+                str(taxid): {sample: taxid for sample in samples[taxid::500]}
+                for taxid in range(100)
+            },
+            mgs.TAX_TREE_PATH: [0] + [[taxid] for taxid in range(1, 100)],
+        }.items():
+            (root / path).parent.mkdir(parents=True, exist_ok=True)
+            (root / path).write_text(json.dumps(contents))
+        source = mgs.LocalDirectory(root)
+
+        def retained(**kwargs) -> tuple[mgs.MGSData, int]:
+            tracemalloc.start()
+            try:
+                mgs_data = mgs.MGSData.from_source(source, **kwargs)
+                return mgs_data, tracemalloc.get_traced_memory()[0]
+            finally:
+                tracemalloc.stop()
+
+        # Lazy first, so it pays for anything loaded on first use.
+        lazy, lazy_bytes = retained(bioprojects=["bp0"])
+        full, full_bytes = retained()
+        self.assertLess(lazy_bytes, full_bytes)
+        self.assertEqual(len(lazy.sample_attrs), 100)
+        lazy.ensure_loaded(lazy.bioprojects)
+        self.assertEqual(lazy, full)
+
+    def test_count_tree(self):
+        source = mgs.LocalDirectory(self.root)
+        mgs_data = mgs.MGSData.from_source(source, bioprojects=["bp2"])
+        self.assertEqual(
+            mgs_data.count_tree(["bp1"]),
+            Tree((0, Counter({"s1": 1})), [Tree((3, Counter({"s2": 4})))]),
+        )
+        self.assertIsNone(
+            mgs_data.count_tree(["bp2"], enrichment=mgs.Enrichment.VIRAL)
+        )
+
+    def test_tarball(self):
+        archive = Path(self.tmpdir.name) / "mgs-pipeline.tar.gz"
+        with tarfile.open(archive, "w:gz") as tar:
+            tar.add(self.root, arcname="mgs-pipeline-data-2023-07-21")
+        self.check_source(mgs.Tarball(archive))
+
+    def test_tarball_nested_decoy(self):
+        decoy = Path(self.tmpdir.name) / "decoy.json"
+        decoy.write_text(json.dumps({"decoy": []}))
+        archive = Path(self.tmpdir.name) / "mgs-pipeline.tar"
+        with tarfile.open(archive, "w") as tar:
+            # Comes first, but is two directories down.
+            tar.add(decoy, arcname="repo/old/" + mgs.BIOPROJECTS_PATH)
+            tar.add(self.root, arcname="repo")
+        self.check_source(mgs.Tarball(archive))
+
+    def test_http(self):
+        class QuietHandler(http.server.SimpleHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+        server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0),
+            functools.partial(QuietHandler, directory=str(self.root)),
+        )
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            host, port = server.server_address[:2]
+            self.check_source(mgs.HTTPSource(f"http://{host}:{port}/"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+class FakeGitHubRepo(mgs.GitHubRepo):
+    downloads: list[str]
+    tags = ["ref-1", "ref-2"]
+
+    def _is_tag(self) -> bool:
+        return self.ref in self.tags
+
+    def _download(self, path: str) -> bytes:
+        self.downloads.append(path)
+        return b"contents of %s" % path.encode()
+
+
+class TestGitHubRepoCache(unittest.TestCase):
+    path = "dashboard/metadata_bioprojects.json"
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.cache_dir = Path(self.tmpdir.name)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def repo(self, offline=False, ref="ref-1") -> FakeGitHubRepo:
+        repo = FakeGitHubRepo(
+            "user", "repo", ref, cache_dir=self.cache_dir, offline=offline
+        )
+        repo.downloads = []
+        return repo
+
+    def test_downloads_once(self):
+        repo = self.repo()
+        self.assertEqual(repo.get_file(self.path), repo.get_file(self.path))
+        self.assertEqual(repo.downloads, [self.path])
+        # A fresh instance shares the on-disk cache.
+        repo = self.repo()
+        repo.get_file(self.path)
+        self.assertEqual(repo.downloads, [])
+
+    def test_keyed_by_ref(self):
+        self.repo(ref="ref-1").get_file(self.path)
+        repo = self.repo(ref="ref-2")
+        repo.get_file(self.path)
+        self.assertEqual(repo.downloads, [self.path])
+
+    def test_branches_not_cached(self):
+        for _ in range(2):
+            repo = self.repo(ref="main")
+            repo.get_file(self.path)
+            self.assertEqual(repo.downloads, [self.path])
+        with self.assertRaises(ValueError):
+            self.repo(ref="main", offline=True).get_file(self.path)
+
+        # Commit shas are pinned even though they aren't tags.
+        sha = "0123456789abcdef0123456789abcdef01234567"
+        self.repo(ref=sha).get_file(self.path)
+        repo = self.repo(ref=sha)
+        repo.get_file(self.path)
+        self.assertEqual(repo.downloads, [])
+
+    def test_is_tag(self):
+        repo = mgs.GitHubRepo("user", "repo", "main", cache_dir=None)
+        for code, warns in [(404, False), (403, True)]:
+            error = urllib.error.HTTPError("url", code, "error", {}, None)
+            with self.subTest(code=code), mock.patch.object(
+                mgs, "download", side_effect=error
+            ), self.assertLogs(mgs.logger, "WARNING") as logs:
+                self.assertFalse(repo._is_tag())
+                # assertLogs needs at least one record.
+                mgs.logger.warning("done")
+            self.assertEqual(len(logs.records), 2 if warns else 1)
+        with mock.patch.object(mgs, "download", return_value=b"{}"):
+            self.assertTrue(repo._is_tag())
+        # The default is known to be a tag without asking.
+        with mock.patch.object(mgs, "download", side_effect=AssertionError):
+            self.assertTrue(
+                mgs.GitHubRepo(**mgs.MGS_REPO_DEFAULTS, cache_dir=None).pinned
+            )
+
+    def test_offline(self):
+        with self.assertRaises(ValueError):
+            self.repo(offline=True).get_file(self.path)
+        expected = self.repo().get_file(self.path)
+        self.assertEqual(self.repo(offline=True).get_file(self.path), expected)
+
+    def test_corrupt_object(self):
+        repo = self.repo()
+        repo.get_file(self.path)
+        (obj,) = (self.cache_dir / "objects").glob("*/*")
+        obj.write_bytes(b"garbage")
+        with self.assertRaises(ValueError):
+            self.repo(offline=True).get_file(self.path)
+        repo = self.repo()
+        self.assertEqual(
+            repo.get_file(self.path), b"contents of " + self.path.encode()
+        )
+        self.assertEqual(repo.downloads, [self.path])
+
+    def test_corrupt_ref(self):
+        self.repo().get_file(self.path)
+        ref = self.cache_dir / "refs" / "user" / "repo" / "ref-1" / self.path
+        for contents in [b"", b"abc", b"\xff\xfe"]:
+            ref.write_bytes(contents)
+            with self.assertRaises(ValueError):
+                self.repo(offline=True).get_file(self.path)
+            repo = self.repo()
+            self.assertEqual(
+                repo.get_file(self.path), b"contents of " + self.path.encode()
+            )
+            self.assertEqual(repo.downloads, [self.path])
+
+
 class TestWeightedAverageByPopulation(unittest.TestCase):
     def test_weightedAverageByPopulation(self):
         prevalences = [
@@ -330,6 +1085,144 @@ class TestWeightedAverageByPopulation(unittest.TestCase):
         )
 
 
+class TestPredictorTable(unittest.TestCase):
+    populations = [
+        Population(
+            people=1000,
+            country="United States",
+            state="Ohio",
+            county="Greene County",
+            date="2021",
+        ),
+        Population(
+            people=2000,
+            country="United States",
+            state="Ohio",
+            county="Lucas County",
+            date="2021",
+        ),
+    ]
+    underreporting = Scalar(scalar=4.0)
+
+    def absolute(self):
+        return PredictorTable.build(
+            IncidenceAbsolute,
+            [10, 20, 30],
+            date=[
+                datetime.date(2021, 1, 1),
+                datetime.date(2021, 1, 2),
+                datetime.date(2021, 1, 1),
+            ],
+            country="United States",
+            state="Ohio",
+            county=["Greene County", "Greene County", "Lucas County"],
+        )
+
+    def test_build(self):
+        table = self.absolute()
+        self.assertEqual(len(table), 3)
+        self.assertEqual(
+            list(table),
+            [
+                IncidenceAbsolute(
+                    annual_infections=annual_infections,
+                    country="United States",
+                    state="Ohio",
+                    county=county,
+                    date=date,
+                )
+                for annual_infections, county, date in [
+                    (10, "Greene County", "2021-01-01"),
+                    (20, "Greene County", "2021-01-02"),
+                    (30, "Lucas County", "2021-01-01"),
+                ]
+            ],
+        )
+        self.assertEqual(table[-1], table[2])
+        self.assertEqual(list(table[1:]), list(table)[1:])
+        with self.assertRaises(IndexError):
+            table[3]
+
+        table = PredictorTable.build(
+            Prevalence,
+            np.array([1.5]),
+            start_date="2020",
+            end_date="2021",
+            taxid=TaxID(1),
+            is_pseudocount=True,
+            active=Active.LATENT,
+        )
+        (prevalence,) = table
+        self.assertEqual(
+            prevalence,
+            Prevalence(
+                infections_per_100k=1.5,
+                start_date="2020",
+                end_date="2021",
+                taxid=TaxID(1),
+                is_pseudocount=True,
+                active=Active.LATENT,
+            ),
+        )
+        with self.assertRaises(ValueError):
+            PredictorTable.build(Scalar, [1], date="2020")
+
+    def test_arithmetic(self):
+        table = self.absolute()
+        populations = [self.populations[i] for i in [0, 0, 1]]
+        rates = table.to_rate(populations) * self.underreporting
+        expected = [
+            estimate.to_rate(population) * self.underreporting
+            for estimate, population in zip(table, populations)
+        ]
+        self.assertEqual(list(rates), expected)
+        for rate, estimate in zip(rates, expected):
+            self.assertEqual(rate.all_inputs, estimate.all_inputs)
+        np.testing.assert_array_equal(
+            rates.get_data(), [e.get_data() for e in expected]
+        )
+        self.assertEqual(rates[1], expected[1])
+
+        doubling = Scalar(scalar=2)
+        scalars = [doubling, self.underreporting, doubling]
+        scaled = rates.scale(
+            [self.underreporting, doubling], np.array([1, 0, 1])
+        )
+        self.assertEqual(
+            list(scaled),
+            [rate * scalar for rate, scalar in zip(rates, scalars)],
+        )
+
+        # The populations have to be for the same place and year.
+        with self.assertRaises(AssertionError):
+            table.to_rate(self.populations[0])
+        with self.assertRaises(TypeError):
+            table * self.underreporting
+
+    def test_by_taxids(self):
+        chars = PathogenChars(
+            na_type=NAType.RNA,
+            enveloped=Enveloped.ENVELOPED,
+            selection=SelectionRound.ROUND_1,
+            taxids=frozenset([TaxID(1), TaxID(2)]),
+        )
+        table = PredictorTable.build(
+            IncidenceRate,
+            [1, 2, 3, 4],
+            date="2020",
+            taxid=[2, 0, 2, 1],
+        )
+        groups = by_taxids(chars, table)
+        self.assertEqual(
+            {taxids: list(rows) for taxids, rows in groups.items()},
+            by_taxids(chars, list(table)),
+        )
+        self.assertEqual(
+            list(groups),
+            [frozenset([2]), chars.taxids, frozenset([1])],
+        )
+
+
 class TestMGSData(unittest.TestCase):
     mgs_data = mgs.MGSData.from_repo()
     (bioproject,) = mgs.target_bioprojects["rothman"]
@@ -339,6 +1232,32 @@ class TestMGSData(unittest.TestCase):
     def test_from_repo(self):
         self.assertIsInstance(mgs.MGSData.from_repo(), mgs.MGSData)
 
+    def test_from_repo_cache_dir(self):
+        for cache_dir, expected in [
+            (mgs.Default.DEFAULT, mgs.default_cache_dir()),
+            (None, None),
+            (Path("/tmp/mgs"), Path("/tmp/mgs")),
+        ]:
+            with self.subTest(cache_dir=cache_dir), mock.patch.object(
+                mgs.MGSData, "from_source"
+            ) as from_source:
+                mgs.MGSData.from_repo(cache_dir=cache_dir)
+                (repo,), _ = from_source.call_args
+                self.assertEqual(repo.cache_dir, expected)
+
+    def test_load_timings(self):
+        self.assertEqual(
+            sorted(t.path for t in self.mgs_data.load_timings),
+            sorted(
+                [
+                    mgs.BIOPROJECTS_PATH,
+                    mgs.SAMPLES_PATH,
+                    mgs.SAMPLE_COUNTS_PATH,
+                    mgs.TAX_TREE_PATH,
+                ]
+            ),
+        )
+
     def test_sample_attributes(self):
         samples = self.mgs_data.sample_attributes(self.bioproject)
         self.assertIn(self.sample, samples)
@@ -378,6 +1297,25 @@ class TestTree(unittest.TestCase):
         for i in range(3):
             self.assertIn(i, self.node)
 
+    def test_index(self):
+        tree = Tree.tree_from_list([0, [1, [3], [1]], [2, [5]]])
+        for i in [0, 1, 2, 3, 5, 7]:
+            with self.subTest(i=i):
+                self.assertIs(tree[i], tree._scan(i))
+        # Subtrees and mapped trees get their own index.
+        self.assertIs(tree[2][5], tree[5])
+        self.assertNotIn(1, tree[2])
+        self.assertEqual(tree.map(lambda x: x + 10)[15], Tree(15))
+
+    def test_unhashable(self):
+        tree = Tree([0], [Tree([1]), Tree([2])])
+        self.assertEqual(tree[[2]], Tree([2]))
+        self.assertNotIn([3], tree)
+
+    def test_str(self):
+        tree = Tree.tree_from_list([0, [1, [3]], [2]])
+        self.assertEqual(str(tree), "0\n.1\n..3\n.2\n")
+
     def test_to_list(self):
         self.assertEqual(self.leaf.to_list(), [0])
         self.assertEqual(self.node.to_list(), [0, [1], [2]])
@@ -386,6 +1324,16 @@ class TestTree(unittest.TestCase):
         self.assertEqual(self.node, Tree.tree_from_list(self.node.to_list()))
         self.assertEqual(self.leaf, Tree.tree_from_list(self.leaf.to_list()))
 
+    def test_preorder(self):
+        tree = Tree.tree_from_list([0, [1, [3], [4]], [2, [5]]])
+        self.assertEqual(
+            tree.to_preorder(), ([0, 1, 3, 4, 2, 5], [-1, 0, 1, 1, 0, 4])
+        )
+        self.assertEqual(tree, Tree.from_preorder(*tree.to_preorder()))
+        self.assertEqual(
+            self.leaf, Tree.from_preorder(*self.leaf.to_preorder())
+        )
+
     def test_map(self):
         f = lambda x: x + 1
         self.assertEqual(self.leaf.map(f), Tree(1))
@@ -408,6 +1356,93 @@ class TestTree(unittest.TestCase):
         )
 
 
+class TestFlatTree(unittest.TestCase):
+    nested = [0, [1, [3], [4]], [2, [5]]]
+    flat = FlatTree.from_list(nested)
+
+    def test_arrays(self):
+        self.assertEqual(self.flat.data.tolist(), [0, 1, 3, 4, 2, 5])
+        self.assertEqual(self.flat.parents.tolist(), [-1, 0, 1, 1, 0, 4])
+        self.assertEqual(self.flat.ends.tolist(), [6, 4, 3, 4, 6, 6])
+        self.assertEqual(self.flat.depths.tolist(), [0, 1, 2, 2, 1, 2])
+
+    def test_conversions(self):
+        tree = Tree.tree_from_list(self.nested)
+        self.assertEqual(self.flat.to_list(), self.nested)
+        self.assertEqual(self.flat.to_tree(), tree)
+        flat = FlatTree.from_tree(tree)
+        self.assertEqual(flat.data.tolist(), self.flat.data.tolist())
+        self.assertEqual(flat.ends.tolist(), self.flat.ends.tolist())
+        self.assertEqual(FlatTree.from_list([7]).to_list(), [7])
+
+    def test_queries(self):
+        flat = self.flat
+        self.assertEqual(flat.nodes([4, 9, 0]).tolist(), [3, -1, 0])
+        self.assertIn(5, flat)
+        self.assertNotIn(9, flat)
+        self.assertEqual(flat.data[flat.subtree(1)].tolist(), [1, 3, 4])
+        ancestors = flat.nodes([1, 1, 1, 2])
+        nodes = flat.nodes([1, 3, 5, 5])
+        self.assertEqual(
+            flat.is_ancestor(ancestors, nodes).tolist(),
+            [True, True, False, True],
+        )
+
+    def test_clade_sums(self):
+        flat = self.flat
+        tree = Tree.tree_from_list(self.nested)
+        values = np.array([1, 10, 100, 1000, 10000, 100000])
+        sums = flat.clade_sums(values)
+        for i, value in enumerate(flat.data.tolist()):
+            subtree = tree[value]
+            assert subtree is not None
+            self.assertEqual(
+                sums[i], sum(values[flat.nodes([n.data])[0]] for n in subtree)
+            )
+        # Columns are summed independently.
+        self.assertEqual(
+            flat.clade_sums(np.stack([values, 2 * values], axis=1))[
+                1
+            ].tolist(),
+            [1110, 2220],
+        )
+
+    def test_prune(self):
+        flat = FlatTree.from_list([0, [1, [3], [4, [6]]], [2, [5]]])
+        self.assertEqual(
+            flat.prune(flat.nodes([6, 2])).to_list(), [0, [1, [4, [6]]], [2]]
+        )
+        self.assertEqual(flat.prune(flat.nodes([0])).to_list(), [0])
+
+    def test_resolve(self):
+        flat = FlatTree.from_list([0, [1, [3], [4, [6]]], [2, [5]]])
+        self.assertEqual(
+            flat.nearest_ancestors({1, 5}).tolist(), [-1, 1, 1, 1, 1, -1, 6]
+        )
+        taxids = np.array([6, 3, 2, 5, 9, 0])
+        self.assertEqual(
+            flat.resolve(taxids, {1, 5}).tolist(), [1, 1, -1, 5, -1, -1]
+        )
+        self.assertEqual(
+            flat.resolve(list(taxids), {4, 0}).tolist(), [4, 0, 0, 0, -1, 0]
+        )
+        # Hashed and searchsorted lookups agree.
+        self.assertEqual(
+            flat.nodes(taxids).tolist(), flat.nodes(list(taxids)).tolist()
+        )
+
+    def test_deep(self):
+        depth = 10_000
+        nested: list = [depth]
+        for i in reversed(range(depth)):
+            nested = [i, nested]
+        flat = FlatTree.from_list(nested)
+        self.assertEqual(flat.depths[-1], depth)
+        tree = flat.to_tree()
+        self.assertEqual(tree.map(lambda x: -x).to_list()[0], 0)
+        self.assertEqual(len(list(Tree.tree_from_list(nested))), depth + 1)
+
+
 class TestPopulations(unittest.TestCase):
     def test_county_state(self):
         self.assertEqual(
@@ -477,6 +1512,102 @@ class TestPopulations(unittest.TestCase):
             ),
         )
 
+    def test_not_found(self):
+        for kwargs in [
+            dict(state="Atlantis"),
+            dict(county="Bristol County"),
+            dict(county="Atlantis County", state="Rhode Island"),
+        ]:
+            with self.subTest(**kwargs):
+                with self.assertRaises(Exception):
+                    populations.us_population(year=2022, **kwargs)
+        with self.assertRaises(Exception):
+            populations.us_population(year=2019)
+
+    def test_index(self):
+        populations.load_population_table()
+        for year in populations.CENSUS_YEARS:
+            state_total = sum(
+                counts.people
+                for (
+                    _,
+                    state,
+                    county,
+                    y,
+                    _,
+                ), counts in populations.population_table.items()
+                if county and state == "Rhode Island" and y == year
+            )
+            self.assertEqual(
+                populations.us_population(
+                    state="Rhode Island", year=year
+                ).people,
+                state_total,
+            )
+        self.assertIs(
+            populations.us_population(state="Ohio", year=2021),
+            populations.us_population(state="Ohio", year=2021),
+        )
+
+    def test_ages(self):
+        denmark = populations.population("Denmark", 2023)
+        self.assertEqual(denmark.people, 5_946_984)
+        self.assertEqual(denmark.country, "Denmark")
+        self.assertEqual(denmark.get_dates()[0], datetime.date(2023, 1, 1))
+        bands = [(0, 0), (1, 3), (4, 17), (18, None)]
+        self.assertEqual(
+            sum(
+                populations.population("Denmark", 2023, ages=ages).people
+                for ages in bands
+            ),
+            denmark.people,
+        )
+        self.assertEqual(
+            populations.population("Denmark", 2023, ages=(0, 0)).people,
+            66_629,
+        )
+        self.assertEqual(
+            populations.population("Denmark", 2023, ages=(18, None)).people,
+            populations.population("Denmark", 2023, ages=(18, 150)).people,
+        )
+        self.assertEqual(
+            populations.population("Denmark", 2023, ages=(1, 3)).tag,
+            "1-3yo",
+        )
+        with self.assertRaises(Exception):
+            populations.population("United States", 2022, ages=(0, 17))
+
+    def test_cohorts(self):
+        white = populations.population("United States", 2020, cohort="white")
+        self.assertEqual(white.people, 191_697_647)
+        self.assertEqual(white.tag, "white")
+        self.assertEqual(
+            populations.population(
+                "United States", 2020, cohort="white", ages=(0, 0)
+            ).people,
+            # Male and female
+            828_913 + 788_563,
+        )
+
+    def test_threads(self):
+        populations.load_population_table()
+        expected = dict(populations.population_table)
+        populations.population_table.clear()
+        populations._population_table_loaded = False
+
+        barrier = threading.Barrier(8)
+
+        def load():
+            barrier.wait()
+            populations.load_population_table()
+
+        threads = [threading.Thread(target=load) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(populations.population_table, expected)
+
 
 class TestStats(unittest.TestCase):
     attrs = mgs.SampleAttributes(
@@ -562,6 +1693,81 @@ class TestStats(unittest.TestCase):
         # Prefer county match over state
         self.assertEqual(stats.lookup_variables(self.attrs, [v6, v7]), [v7])
 
+    def test_lookup_table(self):
+        table = PredictorTable.build(
+            IncidenceRate,
+            np.arange(8),
+            start_date=[
+                "2019",
+                "2019-05-14",
+                "2019-05-15",
+                "2019-05-31",
+                "2019",
+                "2019",
+                "2019",
+                "2019-05",
+            ],
+            end_date=[
+                "2019",
+                "2019-05-14",
+                "2019-05-15",
+                "2019-05-31",
+                "2019",
+                "2019",
+                "2019",
+                "2019-05",
+            ],
+            country="United States",
+            state=[
+                None,
+                None,
+                None,
+                None,
+                "Pennsylvania",
+                "Pennsylvania",
+                "California",
+                "California",
+            ],
+            county=[
+                None,
+                None,
+                None,
+                None,
+                None,
+                "Allegheny County",
+                "Los Angeles County",
+                "Orange County",
+            ],
+        )
+        rows = list(table)
+        other_attrs = [
+            self.attrs.copy(update=dict(state=None, county=None)),
+            self.attrs.copy(update=dict(country="Denmark")),
+            self.attrs.copy(update=dict(date=datetime.date(2019, 5, 31))),
+            self.attrs.copy(
+                update=dict(state="California", county="Orange County")
+            ),
+            self.attrs.copy(
+                update=dict(state="California", county="San Diego County")
+            ),
+        ]
+        for attrs in [self.attrs] + other_attrs:
+            with self.subTest(attrs=attrs):
+                self.assertEqual(
+                    stats.lookup_variables(attrs, table),
+                    stats.lookup_variables(attrs, rows),
+                )
+        for indices in [[0, 2], [2, 3], [1, 2, 3]]:
+            with self.subTest(indices=indices):
+                self.assertEqual(
+                    stats.lookup_variables(
+                        self.attrs, table.select(np.array(indices))
+                    ),
+                    stats.lookup_variables(
+                        self.attrs, [rows[i] for i in indices]
+                    ),
+                )
+
     def test_build_model(self):
         mgs_data = mgs.MGSData.from_repo()
         for (
@@ -604,6 +1810,22 @@ class TestStats(unittest.TestCase):
                         len(model.data), len(all_sample_attributes)
                     )
 
+    def test_build_model_no_bioprojects(self):
+        pathogen = pathogens.pathogens["sars_cov_2"]
+        ((taxids, predictors),) = by_taxids(
+            pathogen.pathogen_chars, pathogen.estimate_incidences()
+        ).items()
+        self.assertIsNone(
+            stats.build_model(
+                mgs.MGSData.from_repo(),
+                [],
+                predictors,
+                taxids,
+                random_seed=1,
+                enrichment=None,
+            )
+        )
+
     def test_fit_model(self):
         mgs_data = mgs.MGSData.from_repo()
         pathogen = pathogens.pathogens["sars_cov_2"]
@@ -1,7 +1,11 @@
 from __future__ import annotations
 
+from collections.abc import Collection, Iterator
 from dataclasses import dataclass, field
-from typing import Callable, Generic, TypeVar
+from functools import cached_property
+from typing import Callable, Generic, Optional, Sequence, TypeVar
+
+import numpy as np
 
 T = TypeVar("T")
 S = TypeVar("S")
@@ -11,20 +15,32 @@ S = TypeVar("S")
 class Tree(Generic[T]):
     data: T
     children: list[Tree[T]] = field(default_factory=list)
-
-    def _str_helper(self, depth: int) -> str:
-        _spacer = "."
-        return f"{_spacer * depth}{self.data}\n" + "".join(
-            c._str_helper(depth + 1) for c in self.children
-        )
+    # First node in preorder for each value, built on the first lookup.
+    _index: Optional[dict[T, Tree[T]]] = field(
+        default=None, init=False, repr=False, compare=False
+    )
+    _unhashable: bool = field(
+        default=False, init=False, repr=False, compare=False
+    )
 
     def __str__(self) -> str:
-        return self._str_helper(0)
+        _spacer = "."
+        lines = []
+        stack = [(self, 0)]
+        while stack:
+            node, depth = stack.pop()
+            lines.append(f"{_spacer * depth}{node.data}\n")
+            stack.extend((c, depth + 1) for c in reversed(node.children))
+        return "".join(lines)
 
-    def __iter__(self):
-        yield self
-        for child in self.children:
-            yield from child
+    def __iter__(self) -> Iterator[Tree[T]]:
+        # Preorder.  An explicit stack keeps each step O(1), where nested
+        # generators would cost O(depth).
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
 
     def __getitem__(self, val: T) -> Tree[T] | None:
         return self._get_subtree(val)
@@ -33,6 +49,28 @@ class Tree(Generic[T]):
         return not (self[item] is None)
 
     def _get_subtree(self, val: T) -> Tree[T] | None:
+        """Find the first subtree with data val, in preorder.
+
+        Uses an index built on the first call, so don't modify the tree after
+        looking things up in it.  Falls back to a depth-first search if the
+        data isn't hashable.
+        """
+        if self._index is None and not self._unhashable:
+            index: dict[T, Tree[T]] = {}
+            try:
+                for subtree in self:
+                    index.setdefault(subtree.data, subtree)
+                self._index = index
+            except TypeError:
+                self._unhashable = True
+        if self._index is not None:
+            try:
+                return self._index.get(val)
+            except TypeError:
+                pass
+        return self._scan(val)
+
+    def _scan(self, val: T) -> Tree[T] | None:
         """Depth-first search for taxid"""
         for subtree in self:
             if subtree.data == val:
@@ -41,13 +79,249 @@ class Tree(Generic[T]):
             return None
 
     def to_list(self) -> list:
-        return [self.data] + [c.to_list() for c in self.children]
+        data, parents = self.to_preorder()
+        lists: list[list] = []
+        for value, parent in zip(data, parents):
+            node = [value]
+            if parent >= 0:
+                lists[parent].append(node)
+            lists.append(node)
+        return lists[0]
 
     def map(self, f: Callable[[T], S]) -> Tree[S]:
-        return Tree(f(self.data), [c.map(f) for c in self.children])
+        data, parents = self.to_preorder()
+        return Tree.from_preorder([f(value) for value in data], parents)
+
+    def to_preorder(self) -> tuple[list[T], list[int]]:
+        """Flatten to node data in preorder plus each node's parent index.
+
+        The root's parent is -1.  Inverse of from_preorder.
+        """
+        data: list[T] = []
+        parents: list[int] = []
+        stack: list[tuple[Tree[T], int]] = [(self, -1)]
+        while stack:
+            node, parent = stack.pop()
+            index = len(data)
+            data.append(node.data)
+            parents.append(parent)
+            stack.extend((c, index) for c in reversed(node.children))
+        return data, parents
+
+    @staticmethod
+    def from_preorder(data: Sequence[T], parents: Sequence[int]) -> Tree[T]:
+        nodes: list[Tree[T]] = []
+        for value, parent in zip(data, parents):
+            node = Tree(value)
+            if parent >= 0:
+                nodes[parent].children.append(node)
+            nodes.append(node)
+        return nodes[0]
 
     @staticmethod
     def tree_from_list(input: list) -> Tree:
-        return Tree(
-            data=input[0], children=[Tree.tree_from_list(c) for c in input[1:]]
+        root = Tree(input[0])
+        stack = [(root, input)]
+        while stack:
+            node, children = stack.pop()
+            for child in children[1:]:
+                child_node = Tree(child[0])
+                node.children.append(child_node)
+                stack.append((child_node, child))
+        return root
+
+
+@dataclass(eq=False)
+class FlatTree(Generic[T]):
+    """A tree stored as arrays, with nodes numbered in preorder.
+
+    Node i's parent is parents[i] (-1 for the root) and its subtree is the
+    nodes i through ends[i] - 1, so subtree and ancestry queries are slices
+    and comparisons instead of walks.
+    """
+
+    data: np.ndarray  # node data, in preorder
+    parents: np.ndarray  # int32
+    ends: np.ndarray  # int32, one past the last node in each subtree
+    depths: np.ndarray  # int32, 0 for the root
+    # Node number of the first node with each value.
+    index: dict[T, int] = field(init=False, repr=False)
+    # Tables for nearest_ancestors, by the set of marked values.
+    _ancestor_tables: dict[frozenset[T], np.ndarray] = field(
+        default_factory=dict, init=False, repr=False
+    )
+
+    def __post_init__(self) -> None:
+        self.index = {}
+        for i, value in enumerate(self.data.tolist()):
+            self.index.setdefault(value, i)
+
+    @staticmethod
+    def from_preorder(
+        data: Sequence[T] | np.ndarray, parents: Sequence[int] | np.ndarray
+    ) -> FlatTree[T]:
+        parent_list = np.asarray(parents).tolist()
+        n = len(parent_list)
+        # Parents come before their children in preorder, so one pass down
+        # gives the depths and one pass up gives the subtree sizes.
+        depths = [0] * n
+        for i in range(1, n):
+            depths[i] = depths[parent_list[i]] + 1
+        sizes = [1] * n
+        for i in range(n - 1, 0, -1):
+            sizes[parent_list[i]] += sizes[i]
+        return FlatTree(
+            data=np.asarray(data),
+            parents=np.array(parent_list, dtype=np.int32),
+            ends=(np.arange(n) + np.array(sizes)).astype(np.int32),
+            depths=np.array(depths, dtype=np.int32),
+        )
+
+    @staticmethod
+    def from_tree(tree: Tree[T]) -> FlatTree[T]:
+        return FlatTree.from_preorder(*tree.to_preorder())
+
+    @staticmethod
+    def from_list(input: list) -> FlatTree:
+        """Build from the nested [data, child, child, ...] list format."""
+        data = []
+        parents = []
+        stack: list[tuple[list, int]] = [(input, -1)]
+        while stack:
+            node, parent = stack.pop()
+            data.append(node[0])
+            parents.append(parent)
+            stack.extend((c, len(data) - 1) for c in reversed(node[1:]))
+        return FlatTree.from_preorder(data, parents)
+
+    def to_tree(self) -> Tree[T]:
+        return Tree.from_preorder(self.data.tolist(), self.parents.tolist())
+
+    def to_list(self) -> list:
+        return self.to_tree().to_list()
+
+    def __len__(self) -> int:
+        return len(self.parents)
+
+    def __contains__(self, value: object) -> bool:
+        return value in self.index
+
+    @cached_property
+    def _sorted(self) -> tuple[np.ndarray, np.ndarray]:
+        # Stable, so the first of any equal values sorts first.
+        order = np.argsort(self.data, kind="stable")
+        return self.data[order], order.astype(np.int32)
+
+    def nodes(self, values: Sequence[T] | np.ndarray) -> np.ndarray:
+        """Node numbers for values, with -1 for any not in the tree."""
+        if isinstance(values, np.ndarray) and (
+            values.dtype.kind in "iu" and self.data.dtype.kind in "iu"
+        ):
+            # Integer data, like taxids, can be looked up without hashing.
+            sorted_data, order = self._sorted
+            if not len(sorted_data):
+                return np.full(len(values), -1, dtype=np.int32)
+            i = np.searchsorted(sorted_data, values)
+            i[i == len(sorted_data)] = 0
+            return np.where(sorted_data[i] == values, order[i], -1).astype(
+                np.int32
+            )
+        if isinstance(values, np.ndarray):
+            values = values.tolist()
+        return np.fromiter(
+            (self.index.get(value, -1) for value in values),
+            dtype=np.int32,
+            count=len(values),
         )
+
+    def nearest_ancestors(self, marked: Collection[T]) -> np.ndarray:
+        """For each node, the nearest marked node at or above it, or -1.
+
+        Computed level by level, so each depth is one numpy operation, and
+        cached for each set of marked values.
+        """
+        key = frozenset(marked)
+        if key not in self._ancestor_tables:
+            is_marked = np.fromiter(
+                (value in key for value in self.data.tolist()),
+                dtype=bool,
+                count=len(self),
+            )
+            table = np.where(is_marked, np.arange(len(self)), -1)
+            by_depth = np.argsort(self.depths, kind="stable")
+            level_starts = np.searchsorted(
+                self.depths[by_depth], np.arange(1, self.depths.max() + 2)
+            )
+            # Parents are one level up, so they're already resolved.
+            for start, end in zip(level_starts, level_starts[1:]):
+                level = by_depth[start:end]
+                level = level[table[level] < 0]
+                table[level] = table[self.parents[level]]
+            self._ancestor_tables[key] = table.astype(np.int32)
+        return self._ancestor_tables[key]
+
+    def resolve(
+        self,
+        values: Sequence[T] | np.ndarray,
+        marked: Collection[T],
+        missing: object = -1,
+    ) -> np.ndarray:
+        """Replace each value with its nearest marked ancestor (or itself).
+
+        Values that aren't in the tree, or that have no marked ancestor,
+        become missing.
+        """
+        nodes = self.nodes(values)
+        ancestors = np.full(len(nodes), -1, dtype=np.int32)
+        found = nodes >= 0
+        ancestors[found] = self.nearest_ancestors(marked)[nodes[found]]
+        resolved = self.data[np.maximum(ancestors, 0)]
+        return np.where(ancestors >= 0, resolved, np.asarray(missing))
+
+    def prune(self, nodes: np.ndarray) -> FlatTree[T]:
+        """The tree restricted to nodes and their ancestors.
+
+        Walks up from nodes, so the cost depends on how many nodes we keep
+        rather than on the size of the tree.
+        """
+        keep = np.zeros(len(self), dtype=bool)
+        frontier = np.unique(nodes)
+        while len(frontier):
+            keep[frontier] = True
+            frontier = self.parents[frontier]
+            frontier = np.unique(frontier[frontier >= 0])
+            frontier = frontier[~keep[frontier]]
+        kept = np.flatnonzero(keep)
+        # A subsequence of a preorder, with every ancestor kept, is still a
+        # preorder.
+        renumbered = np.cumsum(keep) - 1
+        parents = self.parents[kept]
+        return FlatTree.from_preorder(
+            self.data[kept],
+            np.where(parents >= 0, renumbered[np.maximum(parents, 0)], -1),
+        )
+
+    def subtree(self, node: int) -> slice:
+        """The node numbers of node's subtree, including node itself."""
+        return slice(node, self.ends[node])
+
+    def is_ancestor(
+        self, ancestors: np.ndarray | int, nodes: np.ndarray | int
+    ) -> np.ndarray:
+        """Whether each of ancestors is an ancestor of (or is) nodes.
+
+        Takes node numbers and broadcasts like any other numpy comparison.
+        """
+        ancestors = np.asarray(ancestors)
+        nodes = np.asarray(nodes)
+        return (ancestors <= nodes) & (nodes < self.ends[ancestors])
+
+    def clade_sums(self, values: np.ndarray) -> np.ndarray:
+        """Sum values, indexed by node along the first axis, over subtrees.
+
+        Because subtrees are contiguous this is a difference of cumulative
+        sums rather than a walk over the tree.
+        """
+        totals = np.cumsum(values, axis=0)
+        totals = np.concatenate([np.zeros_like(totals[:1]), totals])
+        return totals[self.ends] - totals[: len(self)]